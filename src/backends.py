@@ -0,0 +1,166 @@
+#%%
+import collections
+import time
+import numpy as np
+import profiling
+import run_model
+
+"""
+Solver backends for the matrix form of the model
+
+Every backend takes the ir (model_ir.build_ir) and returns a Solution with
+the same fields, so runs on different solvers report comparable status,
+objective, bound and build / solve times:
+- "gurobi": gurobipy (licence needed)
+- "highs":  HiGHS through highspy
+- "scipy":  HiGHS through scipy.optimize.milp (scipy >= 1.9)
+Each solver is imported only when its backend is used.
+
+params are solver-neutral: time_limit (s), mip_gap (relative), threads and
+output (solver log on/off); a backend ignores the ones it has no setting for.
+scipy.optimize.milp has no thread setting and takes no start solution, so the
+"scipy" backend cannot limit its threads or warm-start; use "highs" for that.
+"""
+
+BACKENDS = ["gurobi","highs","scipy"]
+# backends that use a start solution
+WARM_STARTS = ["gurobi","highs"]
+
+# status: "optimal", "time_limit", "infeasible", "unbounded" or "other";
+# values: variable values in ir order (None without a solution)
+Solution = collections.namedtuple("Solution",["backend","status","objective","bound","values","build_time","solve_time"])
+
+
+# row_bounds(sense,rhs):
+#   lower / upper row activity bounds for '<', '>' and '=' rows
+# Returns -> (float array, float array)
+def row_bounds(sense,rhs):
+    lower = np.where(sense == "<",-np.inf,rhs)
+    upper = np.where(sense == ">",np.inf,rhs)
+    return lower, upper
+
+# gurobi_status(m):
+#   status of a solved gurobipy model, as in Solution
+# Returns -> str
+def gurobi_status(m):
+    from gurobipy import GRB
+    statuses = {GRB.OPTIMAL:"optimal",GRB.TIME_LIMIT:"time_limit",GRB.INFEASIBLE:"infeasible",
+                GRB.UNBOUNDED:"unbounded",GRB.INF_OR_UNBD:"infeasible"}
+    return statuses.get(m.Status,"other")
+
+def solve_gurobi(ir,rhs,integer,params,start_values=None):
+    from gurobipy import GRB
+    grb_params = {"OutputFlag":int(params.get("output",False))}
+    for key,name in (("time_limit","TimeLimit"),("mip_gap","MIPGap"),("threads","Threads")):
+        if key in params:
+            grb_params[name] = params[key]
+
+    start = time.perf_counter()
+    m = run_model.build_ir_model(ir,rhs,grb_params,np.where(integer,GRB.INTEGER,GRB.CONTINUOUS))
+    if start_values is not None:
+        m.setAttr("Start",m.getVars(),np.asarray(start_values,dtype=float).tolist())
+    build_time = time.perf_counter() - start
+    profiling.optimize(m)
+    values = np.array(m.getAttr("X",m.getVars())) if m.SolCount > 0 else None
+    solution = Solution("gurobi",gurobi_status(m),m.ObjVal if m.SolCount > 0 else None,
+                        m.ObjBound if integer.any() else m.ObjVal if m.SolCount > 0 else None,
+                        values,build_time,m.Runtime)
+    m.dispose()
+    return solution
+
+def solve_highs(ir,rhs,integer,params,start_values=None):
+    import highspy
+    statuses = {highspy.HighsModelStatus.kOptimal:"optimal",highspy.HighsModelStatus.kTimeLimit:"time_limit",
+                highspy.HighsModelStatus.kInfeasible:"infeasible",highspy.HighsModelStatus.kUnbounded:"unbounded"}
+
+    start = time.perf_counter()
+    A = run_model.ir_matrix(ir)
+    lp = highspy.HighsLp()
+    lp.num_col_, lp.num_row_ = ir["n_vars"], ir["n_constrs"]
+    lp.col_cost_ = ir["obj"]
+    lp.col_lower_, lp.col_upper_ = np.zeros(ir["n_vars"]), np.full(ir["n_vars"],highspy.kHighsInf)
+    lower, upper = row_bounds(ir["sense"],rhs)
+    lp.row_lower_ = np.maximum(lower,-highspy.kHighsInf)
+    lp.row_upper_ = np.minimum(upper,highspy.kHighsInf)
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kRowwise
+    lp.a_matrix_.num_col_, lp.a_matrix_.num_row_ = ir["n_vars"], ir["n_constrs"]
+    lp.a_matrix_.start_, lp.a_matrix_.index_, lp.a_matrix_.value_ = A.indptr, A.indices, A.data
+    lp.integrality_ = np.where(integer,highspy.HighsVarType.kInteger,highspy.HighsVarType.kContinuous)
+    h = highspy.Highs()
+    h.setOptionValue("output_flag",bool(params.get("output",False)))
+    for key,name in (("time_limit","time_limit"),("mip_gap","mip_rel_gap")):
+        if key in params:
+            h.setOptionValue(name,float(params[key]))
+    if "threads" in params:
+        h.setOptionValue("threads",int(params["threads"]))
+    h.passModel(lp)
+    if start_values is not None:
+        h.setSolution(ir["n_vars"],np.arange(ir["n_vars"],dtype=np.int32),np.asarray(start_values,dtype=float))
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with profiling.span("optimize"):
+        h.run()
+    solve_time = time.perf_counter() - start
+    info = h.getInfo()
+    solved = info.primal_solution_status == highspy.SolutionStatus.kSolutionStatusFeasible
+    bound = info.mip_dual_bound if integer.any() else info.objective_function_value
+    return Solution("highs",statuses.get(h.getModelStatus(),"other"),
+                    info.objective_function_value if solved else None,bound,
+                    np.array(h.getSolution().col_value) if solved else None,build_time,solve_time)
+
+def solve_scipy(ir,rhs,integer,params,start_values=None):
+    from scipy.optimize import Bounds, LinearConstraint, milp
+    statuses = {0:"optimal",1:"time_limit",2:"infeasible",3:"unbounded"}
+
+    start = time.perf_counter()
+    lower, upper = row_bounds(ir["sense"],rhs)
+    constraints = LinearConstraint(run_model.ir_matrix(ir),lower,upper)
+    # milp takes no thread count, params["threads"] is ignored
+    options = {"disp":bool(params.get("output",False))}
+    for key,name in (("time_limit","time_limit"),("mip_gap","mip_rel_gap")):
+        if key in params:
+            options[name] = params[key]
+    build_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    with profiling.span("optimize"):
+        res = milp(ir["obj"],constraints=constraints,integrality=integer.astype(int),
+                   bounds=Bounds(0,np.inf),options=options)
+    solve_time = time.perf_counter() - start
+    bound = getattr(res,"mip_dual_bound",None) if integer.any() else res.fun
+    return Solution("scipy",statuses.get(res.status,"other"),res.fun,bound,res.x,build_time,solve_time)
+
+SOLVERS = {"gurobi":solve_gurobi,"highs":solve_highs,"scipy":solve_scipy}
+
+
+# solve_ir(ir,backend,params,rhs,integer,start):
+#   solves the model of an ir with one of BACKENDS; rhs optionally replaces
+#   ir["rhs"], integer (bool per variable) defaults to all integer and start
+#   (values in ir order) warm-starts the backends of WARM_STARTS
+# Returns -> Solution
+def solve_ir(ir,backend="gurobi",params=None,rhs=None,integer=None,start=None):
+    if backend not in SOLVERS:
+        raise ValueError("unknown backend {}, expected one of {}".format(backend,BACKENDS))
+    rhs = ir["rhs"] if rhs is None else rhs
+    integer = np.ones(ir["n_vars"],dtype=bool) if integer is None else integer
+    return SOLVERS[backend](ir,rhs,integer,params or {},start)
+
+# gap(solution):
+#   relative gap between objective and bound, as Gurobi's MIPGap
+# Returns -> float, None without objective or bound
+def gap(solution):
+    if solution.objective is None or solution.bound is None:
+        return None
+    if solution.objective == 0:
+        return 0.0
+    return abs(solution.objective - solution.bound) / abs(solution.objective)
+
+# report(solution):
+#   one comparable line per solve
+# Returns -> str
+def report(solution):
+    fmt = lambda v,spec: "-" if v is None else format(v,spec)
+    return "Backend {}: {}, objective {}, bound {}, gap {}, build {:.2f}s, solve {:.2f}s".format(
+        solution.backend,solution.status,fmt(solution.objective,",.2f"),fmt(solution.bound,",.2f"),
+        fmt(gap(solution),".2%"),solution.build_time,solution.solve_time)
@@ -0,0 +1,163 @@
+#%%
+import argparse
+import json
+import os
+import platform
+import tempfile
+import time
+import tracemalloc
+import backends
+import format_data
+import model_ir
+import streaming
+import synthetic
+
+"""
+Benchmarks of the full pipeline on synthetic instances
+
+Each instance of SIZES is generated (synthetic.py), then timed stage by stage
+- read:   parsing the csvs (no cache)
+- dicts:  the dict-based generators of format_data (only with --dicts, slow)
+- ir:     model_ir.build_ir, with the presolve
+- stream: the same model with its matrix streamed to disk by day blocks
+          (streaming.py, only with --stream)
+- solve:  model build and solve on one of backends.BACKENDS, with a time
+          limit (only with --solve)
+recording wall time and peak Python/NumPy memory per stage and the variable,
+constraint and nonzero counts of the model. tracemalloc slows allocation-heavy
+stages several times over (build_ir about 4.5x), so each stage runs twice:
+once traced for the peak memory, then once untraced for the time. The solve
+only runs once, untraced (its memory is mostly inside the solver, which
+tracemalloc does not see).
+
+Results can be saved as a baseline and later runs compared against it: a
+stage slower than tolerance x its baseline time (and than min_time), or a
+model of a different size, is reported as a regression (exit code 1).
+
+    python benchmark.py --save baseline.json
+    python benchmark.py --baseline baseline.json
+"""
+
+# gen_instance arguments of each benchmark instance
+SIZES = {"small":{"factories":6,"hospitals":17,"days":10},
+         "medium":{"factories":10,"hospitals":60,"days":20,"density":0.2},
+         "large":{"factories":20,"hospitals":200,"days":30,"density":0.05}}
+
+
+# stage(result,name,func,traced):
+#   runs func() into result["stages"][name]: first under tracemalloc for the
+#   peak memory (skipped when not traced, peak_mb None), then untraced for
+#   the time
+# Returns -> the result of the timed call
+def stage(result,name,func,traced=True):
+    peak = None
+    if traced:
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+        finally:
+            tracemalloc.stop()
+    start = time.perf_counter()
+    value = func()
+    result["stages"][name] = {"time":time.perf_counter() - start,"peak_mb":peak}
+    return value
+
+# stream_matrix(data):
+#   the streamed build of the stream stage, into a temporary directory
+def stream_matrix(data):
+    with tempfile.TemporaryDirectory() as path:
+        ir = model_ir.build_ir(data["factories"],data["resources"],data["hospitals"],data["shipping"],
+                               data["respirators"],data["ppe"],prune=True,coefficients=False)
+        streaming.write_matrix(ir,path,prune=True)
+
+# run_benchmark(data_dir,dicts,solve,time_limit,backend,stream):
+#   runs the pipeline stages on the csvs in data_dir
+# Returns -> dict of stages, counts and solver results
+def run_benchmark(data_dir,dicts=False,solve=False,time_limit=60,backend="gurobi",stream=False):
+    result = {"stages":{}}
+    data = stage(result,"read",lambda: format_data.read_inputs(data_dir,cache_dir=None))
+    if dicts:
+        stage(result,"dicts",lambda: format_data.gen_model_dicts(data))
+    ir = stage(result,"ir",lambda: model_ir.build_ir(data["factories"],data["resources"],data["hospitals"],
+                                                     data["shipping"],data["respirators"],data["ppe"],prune=True))
+    result["counts"] = {"vars":ir["n_vars"],"constrs":ir["n_constrs"],"nonzeros":len(ir["vals"])}
+    if stream:
+        stage(result,"stream",lambda: stream_matrix(data))
+    if not solve:
+        return result
+
+    solution = stage(result,"solve",lambda: backends.solve_ir(ir,backend,{"time_limit":time_limit}),traced=False)
+    result["solver"] = {"backend":backend,"status":solution.status,"objective":solution.objective,
+                        "build_time":solution.build_time,"time":solution.solve_time}
+    return result
+
+# run_suite(sizes,dicts,solve,time_limit,backend,stream):
+#   generates and benchmarks each named instance of SIZES
+# Returns -> dict of instance name -> run_benchmark result
+def run_suite(sizes,dicts=False,solve=False,time_limit=60,backend="gurobi",stream=False):
+    results = {}
+    for name in sizes:
+        with tempfile.TemporaryDirectory() as data_dir:
+            synthetic.write_instance(synthetic.gen_instance(**SIZES[name]),data_dir)
+            results[name] = run_benchmark(data_dir,dicts,solve,time_limit,backend,stream)
+    return results
+
+# compare(results,baseline,tolerance,min_time):
+#   regressions of results against a baseline of the same instances; stages
+#   under min_time seconds are too noisy to compare
+# Returns -> list of str (empty when nothing regressed)
+def compare(results,baseline,tolerance=1.25,min_time=0.05):
+    problems = []
+    for name,result in results.items():
+        if name not in baseline:
+            continue
+        base = baseline[name]
+        if result["counts"] != base["counts"]:
+            problems.append("{}: model size {} != baseline {}".format(name,result["counts"],base["counts"]))
+        for stage_name,timing in result["stages"].items():
+            base_time = base["stages"].get(stage_name,{}).get("time")
+            if base_time is not None and timing["time"] > max(tolerance * base_time,min_time):
+                problems.append("{} {}: {:.3f}s vs baseline {:.3f}s".format(name,stage_name,timing["time"],base_time))
+    return problems
+
+# print_results(results):
+#   one line per instance and stage
+def print_results(results):
+    for name,result in results.items():
+        print("{}: {vars:,} variables, {constrs:,} constraints, {nonzeros:,} nonzeros".format(name,**result["counts"]))
+        for stage_name,timing in result["stages"].items():
+            peak = "" if timing["peak_mb"] is None else "{:9.1f} MB".format(timing["peak_mb"])
+            print("    {:<7} {:8.3f}s {}".format(stage_name,timing["time"],peak).rstrip())
+        if "solver" in result:
+            print("    {backend}: {status}, objective {objective}, build {build_time:.2f}s, solve {time:.2f}s".format(**result["solver"]))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic instances")
+    parser.add_argument("--sizes",nargs="+",default=list(SIZES),choices=list(SIZES),help="instances to run")
+    parser.add_argument("--dicts",action="store_true",help="also time the dict-based generators")
+    parser.add_argument("--stream",action="store_true",help="also time the build with the matrix streamed to disk")
+    parser.add_argument("--solve",action="store_true",help="also build and solve the model")
+    parser.add_argument("--backend",default="gurobi",choices=backends.BACKENDS,help="solver for --solve")
+    parser.add_argument("--time-limit",type=float,default=60,help="time limit per solve")
+    parser.add_argument("--save",help="write the results to this json file (e.g. a new baseline)")
+    parser.add_argument("--baseline",help="json file of an earlier run to compare against")
+    parser.add_argument("--tolerance",type=float,default=1.25,help="allowed slowdown factor per stage")
+    args = parser.parse_args(argv)
+
+    results = run_suite(args.sizes,args.dicts,args.solve,args.time_limit,args.backend,args.stream)
+    print_results(results)
+    if args.save:
+        with open(args.save,"w") as f:
+            json.dump({"machine":platform.node(),"python":platform.python_version(),"results":results},f,indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            problems = compare(results,json.load(f)["results"],args.tolerance)
+        for p in problems:
+            print("REGRESSION " + p)
+        print("{} regressions against {}".format(len(problems),os.path.basename(args.baseline)))
+        return 1 if problems else 0
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,15 +1,28 @@
 #%%
+import argparse
+import collections
+import os
 import read_data
+import model_ir
+import profiling
 import json
 import csv
 
-# read in data
-factories = read_data.read_cost_values("../data/factories.csv")
-respirators = read_data.read_cost_values("../data/respirators.csv")
-ppe = read_data.read_cost_values("../data/ppe.csv")
-resources = read_data.read_list("../data/resources.csv")
-hospitals = read_data.read_demand("../data/hospitals.csv")
-shipping = read_data.read_shipping("../data/shipping.csv")
+"""
+Builds the medical supply model from the csvs in a data directory
+
+Importing this module has no side effects; use it as a library
+    spec = build_model("../data")     -> ModelSpec(data, ir)
+    m = solve(spec)                   -> solved gurobipy model
+or run it as a script (gurobipy is only imported once a solve starts)
+    python format_data.py [--data DIR] [--check]
+"""
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","data")
+CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..",".cache")
+
+# data: parsed inputs from read_inputs; ir: model_ir.build_ir representation
+ModelSpec = collections.namedtuple("ModelSpec",["data","ir"])
 
 
 # add_dummy_shipping(shipping,factories,hospitals,large): 
@@ -28,8 +41,22 @@ def add_dummy_shipping(shipping,factories,hospitals,large=1000000000):
 def add_dummy_factory(factories):
     return {**factories,**{"DUMMY_RESERVE":{}}}
 
-factories = add_dummy_factory(factories)
-shipping = add_dummy_shipping(shipping,factories,hospitals)
+
+# read_inputs(data_dir,cache_dir):
+#   reads all csvs in data_dir and adds the dummy reserve factory and arcs;
+#   parsed files are cached in cache_dir (None to always parse)
+# Returns -> dict of factories, respirators, ppe, resources, hospitals, shipping
+def read_inputs(data_dir=DATA_DIR,cache_dir=CACHE_DIR):
+    def read(reader,name):
+        return read_data.read_cached(reader,os.path.join(data_dir,name),cache_dir)
+    factories = add_dummy_factory(read(read_data.read_cost_values,"factories.csv"))
+    hospitals = read(read_data.read_demand,"hospitals.csv")
+    return {"factories":factories,
+            "respirators":read(read_data.read_cost_values,"respirators.csv"),
+            "ppe":read(read_data.read_cost_values,"ppe.csv"),
+            "resources":read(read_data.read_list,"resources.csv"),
+            "hospitals":hospitals,
+            "shipping":add_dummy_shipping(read(read_data.read_shipping,"shipping.csv"),factories,hospitals)}
 
 
 
@@ -39,50 +66,50 @@ shipping = add_dummy_shipping(shipping,factories,hospitals)
 # get_ppe_names(ppe): 
 #   consumes ppe and output the indiviual ppe names
 # Returns -> list of str
-def get_ppe_names(ppe=ppe):
+def get_ppe_names(ppe):
     return [k for k in ppe.keys()]
 
 # get_respirator_names(respirators): 
 #    consumes respirator and output the indiviual respirator names
 # Returns -> list of str
-def get_respirator_names(respirators=respirators):
+def get_respirator_names(respirators):
     return [k for k in respirators.keys()]
 
 # get_list_equipment(ppe,respirators):
 #    consumes ppe & repirators and output a combination of the names, as list of equipments
 # Returns -> list of str
-def get_list_equipment(ppe=ppe,respirators=respirators):
+def get_list_equipment(ppe,respirators):
     return [k for k in ppe.keys()] + [k for k in respirators.keys()]
 
-# get_all_materials(resources): 
+# get_all_materials(resources,ppe,respirators): 
 #    output a combination of resources and equipments' names, as materials
 # Returns -> list of str
-def get_all_materials(resources=resources):
-    return resources + get_list_equipment()
+def get_all_materials(resources,ppe,respirators):
+    return resources + get_list_equipment(ppe,respirators)
 
 # get_n_days(hospitals): 
 #   count the number of days in the hospital data
 # Returns -> int
-def get_n_days(hospitals=hospitals):
+def get_n_days(hospitals):
     return len(hospitals[0])
 
 
-# get_all_places(resources): consumes resources 
-#    consumes ppe and output a combination of ppe and respirator names, as equipments
+# get_all_places(factories,hospitals):
+#    output a combination of factory and hospital names, as places
 # Returns -> list of str
-def get_all_places(factories=factories,hospitals=hospitals):
+def get_all_places(factories,hospitals):
     return [k for k in factories.keys()] + [r[0] for r in hospitals]
 
 
-#  gen_decision_variables(factories,materials,hospitals,shipping): 
+#  gen_decision_variables(factories,materials,hospitals,shipping,respirators,ppe): 
 #    sets up decision variables
 # Returns -> list of str
-def gen_decision_variables(factories,materials,hospitals,shipping):
-    days = get_n_days()
-    places = get_all_places()
+def gen_decision_variables(factories,materials,hospitals,shipping,respirators,ppe):
+    days = get_n_days(hospitals)
+    places = get_all_places(factories,hospitals)
 
-    resp_made = ["x_{}_{}_{}".format(r,f,day) for day in range(1,days) for f,mats in factories.items() for r in mats.keys() if r in get_respirator_names()]
-    ppe_made = ["y_{}_{}_{}".format(r,f,day) for day in range(1,days) for f,mats in factories.items() for r in mats.keys() if r in get_ppe_names()]
+    resp_made = ["x_{}_{}_{}".format(r,f,day) for day in range(1,days) for f,mats in factories.items() for r in mats.keys() if r in get_respirator_names(respirators)]
+    ppe_made = ["y_{}_{}_{}".format(r,f,day) for day in range(1,days) for f,mats in factories.items() for r in mats.keys() if r in get_ppe_names(ppe)]
     mat_onhand = ["M_{}_{}_{}".format(mat,place,day) for mat in materials for place in places for day in range(1,days)]
     total_shipped = ["s_{}->{}_{}".format(start,end,day) for day in range(1,days) for start,end,cap,cost in shipping]
     shipped = ["z_{}_{}->{}_{}".format(m,start,end,day) for day in range(1,days) for start,end,cap,cost in shipping for m in materials]
@@ -100,11 +127,11 @@ def gen_obj_fxn(decision_vars,shipping):
     return {dv:shipping_costs[dv[:dv.rfind("_")]] for dv in total_shipped}
 
 
-# manufacturing_upper_bounds(factories,resources): 
+# manufacturing_upper_bounds(factories,resources,hospitals): 
 #    establish the upper bounds for manufacturing resources
 # Returns -> dict of manufacturing resources based on (material, factory, day) as "key"
-def manufacturing_upper_bounds(factories,resources):
-    days = get_n_days()
+def manufacturing_upper_bounds(factories,resources,hospitals):
+    days = get_n_days(hospitals)
     return {"manufacturing_{}_{}_{}".format(material,factory,day): 0 for material in resources for factory in factories.keys() if factory != "DUMMY_RESERVE" for day in range(1,days)}
 
 
@@ -112,47 +139,45 @@ def manufacturing_upper_bounds(factories,resources):
 #    establish upper bounds for hospital demand
 # Returns -> dict of hospital demand based on (equipment,place,day) as "key"
 def demand_upper_bounds(hospitals,ppe,respirators):
-    days = get_n_days()
+    days = get_n_days(hospitals)
     demand = {h[0]:h for h in hospitals}
     return {"demand_{}_{}_{}".format(equipment,place,day): -demand[place][day] for place in demand.keys() for day in range(1,days) for equipment in ["ppe","respirators"]}
 
 
-# availability_upper_bounds(resources): 
+# availability_upper_bounds(factories,hospitals,materials): 
 #   upper bound for material available to ship
 # Returns -> dict of hospital demand based on (equipment,place,day) as "key"
-def availability_upper_bounds(resources):
-    places = get_all_places()
-    days = get_n_days()
-    materials = get_all_materials()
-    equipment = get_list_equipment()
+def availability_upper_bounds(factories,hospitals,materials):
+    places = get_all_places(factories,hospitals)
+    days = get_n_days(hospitals)
 
     return {"availability_{}_{}_{}".format(material,place,day): 0 for place in places for day in range(1,days) for material in materials}
     
 
-# shipping_cap_upper_bounds(shipping):
+# shipping_cap_upper_bounds(shipping,hospitals):
 #   establish upper bounds for shipping capacity
 # Returns -> dict of shipping cap based on (arc, day) as "key"
-def shipping_cap_upper_bounds(shipping):
-    days = get_n_days()
+def shipping_cap_upper_bounds(shipping,hospitals):
+    days = get_n_days(hospitals)
     capacities = {"{}->{}".format(start,end):cap for start,end,cap,cost in shipping}
     return {"capacities_{}_{}".format(k,day):v for k,v in capacities.items() for day in range(1,days)}
 
 
-# onhand_equalities(factories,materials):
+# onhand_equalities(factories,materials,resources,hospitals,ppe,respirators):
 #   equalities for next day on-hand resources/materials
 # Returns -> dict of onhand resources based on (material, place, day) as "key"
-def onhand_equalities(factories,materials):
-    places = get_all_places()
-    days = get_n_days()
-    equipment = get_list_equipment()
+def onhand_equalities(factories,materials,resources,hospitals,ppe,respirators):
+    places = get_all_places(factories,hospitals)
+    days = get_n_days(hospitals)
+    equipment = get_list_equipment(ppe,respirators)
     return {"onhand_{}_{}_{}".format(material,place,day): factories[place][material] if day == 1 and place in factories.keys() and material in resources and material in factories[place].keys() else 1000000 if place == "DUMMY_RESERVE" and material in equipment else 0 for material in materials for place in places for day in range(1,days)}
 
 
-# total_shipped_equalities(shipping):
+# total_shipped_equalities(shipping,hospitals):
 #   list out equalities for what was shipped over edge
 # Returns -> dict of shipped recourses based on (start, end, day) as "key"
-def total_shipped_equalities(shipping):
-    days = get_n_days()
+def total_shipped_equalities(shipping,hospitals):
+    days = get_n_days(hospitals)
     return {"shipped_{}->{}_{}".format(start,end,day):0 for day in range(1,days) for start,end,cap,cost in shipping}
 
 
@@ -160,40 +185,40 @@ def total_shipped_equalities(shipping):
 #   generate all upper bounds including (manufacturing, demand, availability, shipping_cap)
 # Returns -> dict of combined upper bounds 
 def gen_upper_bounds(factories,resources,hospitals,materials,shipping):
-    return {**manufacturing_upper_bounds(factories,resources),
-    **demand_upper_bounds(hospitals,materials,resources),
-    **availability_upper_bounds(resources),
-    **shipping_cap_upper_bounds(shipping)}
+    return {**profiling.call(manufacturing_upper_bounds,factories,resources,hospitals),
+    **profiling.call(demand_upper_bounds,hospitals,materials,resources),
+    **profiling.call(availability_upper_bounds,factories,hospitals,materials),
+    **profiling.call(shipping_cap_upper_bounds,shipping,hospitals)}
 
 
-# gen_equalities(factories,materials,shipping):
+# gen_equalities(factories,materials,shipping,resources,hospitals,ppe,respirators):
 #   generate all equalities including (onhand and total_shipped) 
 # Returns -> dict of equalities 
-def gen_equalities(factories,materials,shipping):
-    return {**onhand_equalities(factories,materials),
-    **total_shipped_equalities(shipping)}
+def gen_equalities(factories,materials,shipping,resources,hospitals,ppe,respirators):
+    return {**profiling.call(onhand_equalities,factories,materials,resources,hospitals,ppe,respirators),
+    **profiling.call(total_shipped_equalities,shipping,hospitals)}
 
 
-# manufacturing_recipes(factories,resources,respirators,ppe):
+# manufacturing_recipes(factories,resources,respirators,ppe,hospitals):
 #   generate manufacturing coefficients/recipes of (resp_made, ppe_made, materials_onhand)
 # Returns -> dict of recipes 
-def manufacturing_recipes(factories,resources,respirators,ppe):
-    days = get_n_days()
+def manufacturing_recipes(factories,resources,respirators,ppe,hospitals):
+    days = get_n_days(hospitals)
     resp_made = {("x_{}_{}_{}".format(equip,factory,day),"manufacturing_{}_{}_{}".format(material,factory,day)): respirators[equip][material] if material in respirators[equip].keys() else 0 for material in resources for factory,things in factories.items() if factory != "DUMMY_RESERVE" for equip in things if equip in respirators.keys() for day in range(1,days)}
     ppe_made = {("y_{}_{}_{}".format(equip,factory,day),"manufacturing_{}_{}_{}".format(material,factory,day)): ppe[equip][material] if material in ppe[equip].keys() else 0 for material in resources for factory,things in factories.items() if factory != "DUMMY_RESERVE" for equip in things if equip in ppe.keys() for day in range(1,days)}
     mat_onhand = {("M_{}_{}_{}".format(material,factory,day),"manufacturing_{}_{}_{}".format(material,factory,day)): -1 for material in resources for factory in factories.keys() if factory != "DUMMY_RESERVE" for day in range(1,days)}
     return {**resp_made,**ppe_made,**mat_onhand}
 
 
-# onhand_recipes(factories,resources,shipping,respirators,ppe):
+# onhand_recipes(factories,resources,shipping,respirators,ppe,hospitals):
 #   onhand materials coefficients/recipes as a combination of yesterdays materials, 
 #   added supplies, materals onhand yesterday, shipped in&out yesterday
 # Returns -> dict of onhand_materials recipes
-def onhand_recipes(factories,resources,shipping,respirators,ppe):
-    places = get_all_places()
-    days = get_n_days()
-    materials = get_all_materials(resources)
-    equipment = get_list_equipment()
+def onhand_recipes(factories,resources,shipping,respirators,ppe,hospitals):
+    places = get_all_places(factories,hospitals)
+    days = get_n_days(hospitals)
+    materials = get_all_materials(resources,ppe,respirators)
+    equipment = get_list_equipment(ppe,respirators)
 
     # factories only - subtract used for equipment
     resp_made_yest = {("x_{}_{}_{}".format(equip,factory,day-1),"onhand_{}_{}_{}".format(material,factory,day)): respirators[equip][material] if material in respirators[equip].keys() else 0 for material in resources for factory,things in factories.items() for equip in things if equip in respirators.keys() for day in range(2,days)}
@@ -220,12 +245,12 @@ def onhand_recipes(factories,resources,shipping,respirators,ppe):
             **dummy_day0}
 
 
-# demand_recipes(hospitals,ppe):
+# demand_recipes(hospitals,ppe,shipping,respirators):
 #   ppe and respirator demand coefficients/recipes based on shipped from/to (yesterday), onhand_materials (yesterday)
 # Return -> dict of demand recipes
-def demand_recipes(hospitals,ppe):
-    days = get_n_days()
-    equipment = get_list_equipment()
+def demand_recipes(hospitals,ppe,shipping,respirators):
+    days = get_n_days(hospitals)
+    equipment = get_list_equipment(ppe,respirators)
     hospital_names = [h[0] for h in hospitals]
 
     # hospital total in/outflow
@@ -238,13 +263,12 @@ def demand_recipes(hospitals,ppe):
     return {**shipped_from_yest,**shipped_to_yest,**onhand_yest,**dummy_day0}
 
 
-# availability_recipes(shipping):
+# availability_recipes(shipping,factories,hospitals,materials):
 #   available to ship
 # Return -> dict of availability to shipped
-def availability_recipes(shipping):
-    places = get_all_places()
-    days = get_n_days()
-    materials = get_all_materials()
+def availability_recipes(shipping,factories,hospitals,materials):
+    places = get_all_places(factories,hospitals)
+    days = get_n_days(hospitals)
 
     # all in/outflow
     shipped_from = {("z_{}_{}->{}_{}".format(material,start,end,day),"availability_{}_{}_{}".format(material,place,day)): 1 for day in range(1,days) for start,end,cap,cost in shipping for material in materials for place in places if place == start}
@@ -255,23 +279,22 @@ def availability_recipes(shipping):
     return {**shipped_from,**onhand}#**shipped_to_yest,**onhand}
 
 
-# total_shipped_recipes(shipping):
+# total_shipped_recipes(shipping,hospitals,materials):
 #   shipping over edge coefficients/recipes
 # Return -> dict of total shipped
-def total_shipped_recipes(shipping):
-    days = get_n_days()
-    materials = get_all_materials()
+def total_shipped_recipes(shipping,hospitals,materials):
+    days = get_n_days(hospitals)
 
     total_shipped = {("s_{}->{}_{}".format(start,end,day),"shipped_{}->{}_{}".format(start,end,day)): -1 for day in range(1,days) for start,end,cap,cost in shipping}
     shipped = {("z_{}_{}->{}_{}".format(material,start,end,day),"shipped_{}->{}_{}".format(start,end,day)): 1 for day in range(1,days) for start,end,cap,cost in shipping for material in materials}
     return {**shipped,**total_shipped}
 
 
-# shipping_cap_recipes(shipping):
+# shipping_cap_recipes(shipping,hospitals):
 #   shipping capacity coefficients/recipes
 # Return -> dict of shipping capacities
-def shipping_cap_recipes(shipping):
-    days = get_n_days()
+def shipping_cap_recipes(shipping,hospitals):
+    days = get_n_days(hospitals)
     return {("s_{}->{}_{}".format(start,end,day),"capacities_{}->{}_{}".format(start,end,day)): 1 for day in range(1,days) for start,end,cap,cost in shipping}
 
 
@@ -279,27 +302,146 @@ def shipping_cap_recipes(shipping):
 #   generate combination of all recipes
 # Return -> dict of total recipes
 def gen_recipes(shipping,hospitals,resources,factories,respirators,ppe):
-    return {**shipping_cap_recipes(shipping),
-    **total_shipped_recipes(shipping),
-    **demand_recipes(hospitals,ppe),
-    **availability_recipes(shipping),
-    **onhand_recipes(factories,resources,shipping,respirators,ppe),
-    **manufacturing_recipes(factories,resources,respirators,ppe)}
-
-#%%
-materials = get_all_materials(resources)
-decision_vars = gen_decision_variables(factories,materials,hospitals,shipping)
-objective = gen_obj_fxn(decision_vars,shipping)
-
-upper_bounds = gen_upper_bounds(factories,resources,hospitals,materials,shipping)
-equalities = gen_equalities(factories,materials,shipping)
-recipes = gen_recipes(shipping,hospitals,resources,factories,respirators,ppe)
-
-import gurobipy as gp 
-from gurobipy import GRB 
-import run_model
-
-
-m = run_model.solve(objective, decision_vars, recipes, upper_bounds, equalities)
-
-# %%
+    materials = get_all_materials(resources,ppe,respirators)
+    return {**profiling.call(shipping_cap_recipes,shipping,hospitals),
+    **profiling.call(total_shipped_recipes,shipping,hospitals,materials),
+    **profiling.call(demand_recipes,hospitals,ppe,shipping,respirators),
+    **profiling.call(availability_recipes,shipping,factories,hospitals,materials),
+    **profiling.call(onhand_recipes,factories,resources,shipping,respirators,ppe,hospitals),
+    **profiling.call(manufacturing_recipes,factories,resources,respirators,ppe,hospitals)}
+
+
+### Library API
+
+# gen_model_dicts(data):
+#   the dict-based (named) model for parsed inputs from read_inputs
+# Returns -> dict of decision_vars, objective, upper_bounds, equalities, recipes
+def gen_model_dicts(data):
+    factories, resources, hospitals = data["factories"], data["resources"], data["hospitals"]
+    shipping, respirators, ppe = data["shipping"], data["respirators"], data["ppe"]
+    materials = get_all_materials(resources,ppe,respirators)
+    decision_vars = profiling.call(gen_decision_variables,factories,materials,hospitals,shipping,respirators,ppe)
+    return {"decision_vars":decision_vars,
+            "objective":profiling.call(gen_obj_fxn,decision_vars,shipping),
+            "upper_bounds":profiling.call(gen_upper_bounds,factories,resources,hospitals,materials,shipping),
+            "equalities":profiling.call(gen_equalities,factories,materials,shipping,resources,hospitals,ppe,respirators),
+            "recipes":profiling.call(gen_recipes,shipping,hospitals,resources,factories,respirators,ppe)}
+
+# build_model(data_dir,prune,cache_dir,data):
+#   reads the csvs in data_dir and builds the integer-indexed model; prune
+#   drops unreachable arcs and dead variables first (see presolve.py),
+#   cache_dir is where parsed csvs are cached (see read_inputs) and data
+#   (read_inputs' result) skips reading the csvs again
+# Returns -> ModelSpec
+def build_model(data_dir=DATA_DIR,prune=True,cache_dir=CACHE_DIR,data=None):
+    if data is None:
+        with profiling.span("read_inputs"):
+            data = read_inputs(data_dir,cache_dir)
+    with profiling.span("build_ir"):
+        ir = model_ir.build_ir(data["factories"],data["resources"],data["hospitals"],
+                               data["shipping"],data["respirators"],data["ppe"],prune)
+    if prune:
+        import presolve
+        print(presolve.report(ir))
+    return ModelSpec(data,ir)
+
+# check_model(spec):
+#   compares the integer-indexed model with the dict-based one (the spec must
+#   be built with prune=False)
+# Returns -> list of str describing the mismatches (empty when identical)
+def check_model(spec):
+    dicts = gen_model_dicts(spec.data)
+    return model_ir.compare_with_dicts(spec.ir,dicts["decision_vars"],dicts["objective"],
+                                       dicts["recipes"],dicts["upper_bounds"],dicts["equalities"])
+
+# solve(spec,mode,block_days,write_lp,backend,start):
+#   solves a ModelSpec (the solver is imported here, not on import); mode
+#   "mip" is the full model, see solve_modes for "lp", "xy" and "blocks";
+#   write_lp also writes the LP file next to the results; with a backend
+#   other than gurobi (see backends.py) only "mip" is available; start
+#   (variable values in ir order) warm-starts a "mip" solve on the backends
+#   of backends.WARM_STARTS
+# Returns -> gurobipy model, or backends.Solution for other backends
+def solve(spec,mode="mip",block_days=7,write_lp=False,backend="gurobi",start=None):
+    if backend != "gurobi":
+        import backends
+        import run_model
+        if mode != "mip" or write_lp:
+            raise ValueError("solve modes and the LP file need the gurobi backend")
+        solution = backends.solve_ir(spec.ir,backend,start=start)
+        print(backends.report(solution))
+        run_model.print_values(spec.ir,solution.values,solution.objective)
+        return solution
+    if mode == "mip":
+        import run_model
+        return run_model.solve_ir(spec.ir,write_lp,start)
+    import solve_modes
+    return solve_modes.solve_mode(spec.ir,mode,block_days,write_lp=write_lp)
+
+# run(args):
+#   builds and checks or solves the model for parsed command line arguments
+# Returns -> exit code
+def run(args):
+    cache_dir = None if args.no_cache else CACHE_DIR
+    data = None
+    if args.precheck and not args.check:
+        import precheck
+        data = read_inputs(args.data,cache_dir)
+        result = precheck.check(data)
+        print(precheck.report(result))
+        if (result["missing"] or result["reserve"] > 0) and not args.solve_anyway:
+            print("Not building the model: it is infeasible or must use {} (--solve-anyway to solve it regardless)".format(
+                model_ir.DUMMY))
+            return 1
+    if args.stream and not args.check:
+        import streaming
+        spec = streaming.build_streamed(args.data,args.stream,args.block_days,not args.no_prune,cache_dir,data)
+    else:
+        spec = build_model(args.data,prune=not (args.no_prune or args.check),cache_dir=cache_dir,data=data)
+    if args.check:
+        problems = check_model(spec)
+        for p in problems:
+            print(p)
+        print("{} mismatches".format(len(problems)))
+        return 1 if problems else 0
+    if not args.solution_cache:
+        solve(spec,args.mode,args.block_days,args.lp,args.backend)
+        return 0
+    import solution_cache
+    cache = solution_cache.open_cache(CACHE_DIR,args.solution_cache_mb * 2**20)
+    solution_cache.solve(cache,spec,args.mode,args.block_days,args.lp,args.backend)
+    print(solution_cache.report(cache))
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build and solve the medical supply model")
+    parser.add_argument("--data",default=DATA_DIR,help="directory holding the input csvs")
+    parser.add_argument("--check",action="store_true",help="compare the model with the dict-based version instead of solving")
+    parser.add_argument("--mode",default="mip",choices=["mip","lp","xy","blocks"],help="solve mode (see solve_modes)")
+    parser.add_argument("--backend",default="gurobi",choices=["gurobi","highs","scipy"],help="solver (see backends)")
+    parser.add_argument("--block-days",type=int,default=7,help="days per block in blocks mode and per generated block with --stream")
+    parser.add_argument("--precheck",action="store_true",help="report supply and network bottlenecks before building; stop if the model is infeasible or must use the reserve (see precheck)")
+    parser.add_argument("--solve-anyway",action="store_true",help="with --precheck, build and solve even if the pre-check finds reserve use or infeasibility")
+    parser.add_argument("--no-prune",action="store_true",help="keep the variables the network presolve would drop")
+    parser.add_argument("--no-cache",action="store_true",help="parse the csvs even if a cached copy exists")
+    parser.add_argument("--solution-cache",action="store_true",help="reuse stored solutions of identical inputs and warm-start similar ones (see solution_cache)")
+    parser.add_argument("--solution-cache-mb",type=float,default=256,help="size of the solution cache before the least recently used entries are evicted")
+    parser.add_argument("--stream",metavar="DIR",help="generate the constraint matrix by day blocks into files in DIR (see streaming)")
+    parser.add_argument("--lp",action="store_true",help="also write the LP file (slow on large models)")
+    parser.add_argument("--profile",help="write stage timings, family counts and solver progress to this jsonl file")
+    parser.add_argument("--profile-memory",action="store_true",help="also trace peak memory per stage (slower)")
+    parser.add_argument("--cprofile",help="write cProfile stats of the whole run to this file")
+    args = parser.parse_args(argv)
+
+    if not (args.profile or args.cprofile):
+        return run(args)
+    profiling.enable(memory=args.profile_memory,cprofile=args.cprofile)
+    try:
+        return run(args)
+    finally:
+        records = profiling.disable()
+        if args.profile:
+            profiling.write_jsonl(args.profile,records)
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,663 @@
+#%%
+import bisect
+import numpy as np
+import profiling
+
+"""
+Integer-indexed intermediate representation (IR) of the model
+
+format_data builds the model out of string keys such as "z_metal1_a->b_3"
+paired into tuple-keyed dicts. The IR instead gives every material, place,
+arc and day an integer id, and stores:
+- var_families / constr_families: contiguous blocks of variable / constraint
+                ids, each with NumPy index arrays (material, place, arc, day, type)
+                and a name template
+- rows, cols, vals: constraint coefficients as (row, col, value) triplets
+- obj, rhs, sense: objective coefficients, right-hand sides and '<' / '=' senses
+
+Variables and constraints are laid out in the same order as
+gen_decision_variables, gen_upper_bounds and gen_equalities, so variable id j
+is decision_vars[j]. Human-readable names are only produced on request
+(var_name, constr_name, var_names, constr_names), e.g. when writing the LP
+file or the results.
+
+With build_ir(..., prune=True) the network presolve (presolve.py) drops
+variables that can never carry anything before they are generated, and empty
+constraints afterwards; the families then keep a "map" from their full layout
+to the kept entries, so the *_id helpers still work and return -1 for
+dropped entries.
+
+The coefficients can also be generated for a subset of days only
+(day_coefficients), which streaming.py uses to write the matrix to disk one
+day block at a time.
+"""
+
+DUMMY = "DUMMY_RESERVE"
+DEMAND_TYPES = ["ppe", "respirators"]
+
+
+### Layout helpers
+###     Offsets of each variable/constraint family and lookups of single ids
+
+# add_family(families,name,template,fields,index,offset,keep):
+#   appends a family block starting at offset; index maps each field to an
+#   array; keep optionally selects the entries of the full layout to create
+# Returns -> offset of the next family
+def add_family(families,name,template,fields,index,offset,keep=None):
+    size = len(index[fields[0]]) if fields else 0
+    families.append({"name":name,"template":template,"fields":fields,
+                     "index":{k:np.asarray(v,dtype=np.int64) for k,v in index.items()},
+                     "offset":offset,"size":size})
+    if keep is not None:
+        return compact_family(families[-1],keep,offset)
+    return offset + size
+
+# compact_family(fam,keep,offset):
+#   keeps only the selected entries of a family, moving it to offset; the
+#   family's map (full layout -> position in the family, -1 if dropped) is
+#   updated accordingly
+# Returns -> offset of the next family
+def compact_family(fam,keep,offset):
+    local = np.where(keep,np.cumsum(keep) - 1,-1)
+    if "map" in fam:
+        local = np.where(fam["map"] >= 0,local[np.maximum(fam["map"],0)],-1)
+    fam["map"] = local
+    fam["index"] = {k:v[keep] for k,v in fam["index"].items()}
+    fam["size"] = int(np.count_nonzero(keep))
+    fam["offset"] = offset
+    return offset + fam["size"]
+
+# global_id(fam,pos):
+#   global id of position(s) pos of the family's full layout, -1 if dropped
+# Returns -> int or int array
+def global_id(fam,pos):
+    if "map" not in fam:
+        return fam["offset"] + pos
+    local = fam["map"][pos]
+    return np.where(local >= 0,fam["offset"] + local,-1)
+
+# family(families,name):
+#   looks up a family block by name
+# Returns -> dict
+def family(families,name):
+    for fam in families:
+        if fam["name"] == name:
+            return fam
+    raise KeyError(name)
+
+# family_slice(families,name):
+#   global ids covered by a family block
+# Returns -> slice
+def family_slice(families,name):
+    fam = family(families,name)
+    return slice(fam["offset"],fam["offset"] + fam["size"])
+
+# var_days(ir):
+#   day of every variable (0 for the day-0 dummy shipments)
+# Returns -> int array of length n_vars
+def var_days(ir):
+    return np.concatenate([fam["index"]["day"] for fam in ir["var_families"]])
+
+# constr_days(ir):
+#   day of every constraint
+# Returns -> int array of length n_constrs
+def constr_days(ir):
+    return np.concatenate([fam["index"]["day"] for fam in ir["constr_families"]])
+
+# dummy_supply_vars(ir):
+#   equipment shipped from the dummy reserve to hospitals (z and day-0 z),
+#   i.e. the demand the real network does not meet
+# Returns -> int array of variable ids
+def dummy_supply_vars(ir):
+    ids = []
+    for name in ("z","z0"):
+        fam = family(ir["var_families"],name)
+        arc, mat = fam["index"]["arc"], fam["index"]["material"]
+        keep = ((ir["arc_start"][arc] == ir["dummy"]) & (ir["arc_end"][arc] >= ir["n_factories"])
+                & (mat >= ir["n_resources"]))
+        ids.append(fam["offset"] + np.flatnonzero(keep))
+    return np.concatenate(ids)
+
+# grid(*sizes):
+#   all combinations of range(n) for each size, first size varying slowest
+#   (same order as the nested comprehensions in format_data)
+# Returns -> list of int arrays
+def grid(*sizes):
+    return [a.ravel() for a in np.meshgrid(*[np.arange(n) for n in sizes],indexing="ij")]
+
+
+### IR construction
+
+# build_ir(factories,resources,hospitals,shipping,respirators,ppe,prune,coefficients):
+#   builds the integer-indexed model from the parsed data; factories and shipping
+#   must already include the dummy reserve (add_dummy_factory, add_dummy_shipping);
+#   prune runs the network presolve first (see presolve.py); without
+#   coefficients only the families, obj, rhs and sense are built and the
+#   matrix is left to streaming.write_matrix (empty rows are dropped there)
+# Returns -> dict (see module docstring)
+def build_ir(factories,resources,hospitals,shipping,respirators,ppe,prune=False,coefficients=True):
+    equipment = list(ppe.keys()) + list(respirators.keys())
+    materials = list(resources) + equipment
+    factory_names = list(factories.keys())
+    hospital_names = [h[0] for h in hospitals]
+    places = factory_names + hospital_names
+    place_id = {p:i for i,p in enumerate(places)}
+    mat_id = {m:i for i,m in enumerate(materials)}
+
+    for start,end,cap,cost in shipping:
+        if start not in place_id or end not in place_id:
+            raise ValueError("shipping arc {}->{} refers to an unknown place".format(start,end))
+
+    R, D = len(resources), len(hospitals[0]) - 1
+    ir = {"materials":materials,
+          "n_resources":R,
+          "n_ppe":len(ppe),
+          "places":places,
+          "n_factories":len(factory_names),
+          "dummy":place_id.get(DUMMY,-1),
+          "made":[p for p,name in enumerate(factory_names) if name != DUMMY],
+          "n_days":D + 1,
+          "arc_start":np.array([place_id[s] for s,e,cap,cost in shipping],dtype=np.int64),
+          "arc_end":np.array([place_id[e] for s,e,cap,cost in shipping],dtype=np.int64),
+          "arc_cap":np.array([cap for s,e,cap,cost in shipping],dtype=float),
+          "arc_cost":np.array([cost for s,e,cap,cost in shipping],dtype=float)}
+    ir["dummy_arcs"] = np.flatnonzero(ir["arc_start"] == ir["dummy"])
+    ir["recipe"] = recipe_matrix(materials,R,respirators,ppe)
+
+    # (factory, equipment) pairs that can be made, in gen_decision_variables order
+    for var,book in (("x",respirators),("y",ppe)):
+        pairs = [(place_id[f],mat_id[r]) for f,mats in factories.items() for r in mats.keys() if r in book]
+        ir[var + "_pairs"] = np.array(pairs,dtype=np.int64).reshape(-1,2)
+    ir["stock"] = stock_matrix(ir,factories)
+
+    keep = None
+    if prune:
+        import presolve
+        keep = profiling.call(presolve.feasible_vars,ir)
+    with profiling.span("gen_var_families"):
+        gen_var_families(ir,keep)
+    with profiling.span("gen_constr_families"):
+        gen_constr_families(ir,hospitals)
+    if not coefficients:
+        return ir
+    with profiling.span("gen_coefficients"):
+        gen_coefficients(ir)
+    if prune:
+        with profiling.span("drop_empty_rows"):
+            presolve.drop_empty_rows(ir)
+    profiling.count_families(ir)
+    return ir
+
+# stock_matrix(ir,factories):
+#   day-1 stock of every material at every place; the dummy reserve holds
+#   1000000 of each equipment (every day, see gen_constr_families)
+# Returns -> array [material, place]
+def stock_matrix(ir,factories):
+    stock = np.zeros((len(ir["materials"]),len(ir["places"])))
+    for p,name in enumerate(ir["places"][:ir["n_factories"]]):
+        for k in range(ir["n_resources"]):
+            stock[k,p] = factories[name].get(ir["materials"][k],0)
+    if ir["dummy"] >= 0:
+        stock[ir["n_resources"]:,ir["dummy"]] = 1000000
+    return stock
+
+# recipe_matrix(materials,n_resources,respirators,ppe):
+#   resources needed per unit of each equipment
+# Returns -> array [material, resource] of recipe amounts (0 for non-equipment rows)
+def recipe_matrix(materials,n_resources,respirators,ppe):
+    recipe = np.zeros((len(materials),n_resources))
+    for k,equip in enumerate(materials):
+        book = ppe if equip in ppe else respirators if equip in respirators else {}
+        for r in range(n_resources):
+            recipe[k,r] = book.get(equip,{}).get(materials[r],0)
+    return recipe
+
+# gen_var_families(ir,keep):
+#   lays out x, y, z, s, M and day-0 dummy z variables; keep optionally maps
+#   family names to masks over their full layout
+# Returns -> None, fills ir["var_families"], ir["n_vars"] and ir["obj"]
+def gen_var_families(ir,keep=None):
+    K, A, D = len(ir["materials"]), len(ir["arc_start"]), ir["n_days"] - 1
+    P = len(ir["places"])
+    families, offset = [], 0
+
+    for var in ("x","y"):
+        pairs = ir[var + "_pairs"]
+        day, pair = grid(D,len(pairs))
+        offset = add_family(families,var,var + "_{}_{}_{}",("material","place","day"),
+                            {"material":pairs[pair,1],"place":pairs[pair,0],"day":day + 1},offset)
+    day, arc, mat = grid(D,A,K)
+    keep = keep or {}
+    offset = add_family(families,"z","z_{}_{}_{}",("material","arc","day"),
+                        {"material":mat,"arc":arc,"day":day + 1},offset,keep.get("z"))
+    day, arc = grid(D,A)
+    offset = add_family(families,"s","s_{}_{}",("arc","day"),{"arc":arc,"day":day + 1},offset,keep.get("s"))
+    mat, place, day = grid(K,P,D)
+    offset = add_family(families,"M","M_{}_{}_{}",("material","place","day"),
+                        {"material":mat,"place":place,"day":day + 1},offset,keep.get("M"))
+    rank, mat = grid(len(ir["dummy_arcs"]),K)
+    offset = add_family(families,"z0","z_{}_{}_{}",("material","arc","day"),
+                        {"material":mat,"arc":ir["dummy_arcs"][rank],"day":np.zeros_like(mat)},offset,keep.get("z0"))
+
+    ir["var_families"] = families
+    ir["n_vars"] = offset
+    ir["obj"] = np.zeros(offset)
+    s = family(families,"s")
+    ir["obj"][s["offset"]:s["offset"] + s["size"]] = ir["arc_cost"][s["index"]["arc"]]
+
+# gen_constr_families(ir,hospitals):
+#   lays out manufacturing, demand, availability, capacities (upper bounds)
+#   and onhand, shipped (equalities) constraints with their right-hand sides
+# Returns -> None, fills ir["constr_families"], ir["n_constrs"], ir["rhs"] and ir["sense"]
+def gen_constr_families(ir,hospitals):
+    K, R, A, D = len(ir["materials"]), ir["n_resources"], len(ir["arc_start"]), ir["n_days"] - 1
+    P, made = len(ir["places"]), np.array(ir["made"],dtype=np.int64)
+    families, offset, rhs = [], 0, []
+
+    mat, fac, day = grid(R,len(made),D)
+    offset = add_family(families,"manufacturing","manufacturing_{}_{}_{}",("material","place","day"),
+                        {"material":mat,"place":made[fac],"day":day + 1},offset)
+    rhs.append(np.zeros(len(mat)))
+
+    hosp, day, typ = grid(len(hospitals),D,len(DEMAND_TYPES))
+    offset = add_family(families,"demand","demand_{}_{}_{}",("type","place","day"),
+                        {"type":typ,"place":hosp + ir["n_factories"],"day":day + 1},offset)
+    rhs.append(demand_bounds(ir,hospitals))
+
+    place, day, mat = grid(P,D,K)
+    offset = add_family(families,"availability","availability_{}_{}_{}",("material","place","day"),
+                        {"material":mat,"place":place,"day":day + 1},offset)
+    rhs.append(np.zeros(len(mat)))
+
+    arc, day = grid(A,D)
+    offset = add_family(families,"capacities","capacities_{}_{}",("arc","day"),
+                        {"arc":arc,"day":day + 1},offset)
+    rhs.append(ir["arc_cap"][arc])
+    n_upper = offset
+
+    mat, place, day = grid(K,P,D)
+    offset = add_family(families,"onhand","onhand_{}_{}_{}",("material","place","day"),
+                        {"material":mat,"place":place,"day":day + 1},offset)
+    onhand_rhs = np.where(day == 0,ir["stock"][mat,place],0)
+    onhand_rhs[(place == ir["dummy"]) & (mat >= R)] = 1000000
+    rhs.append(onhand_rhs)
+
+    day, arc = grid(D,A)
+    offset = add_family(families,"shipped","shipped_{}_{}",("arc","day"),
+                        {"arc":arc,"day":day + 1},offset)
+    rhs.append(np.zeros(len(arc)))
+
+    ir["constr_families"] = families
+    ir["n_constrs"] = offset
+    ir["rhs"] = np.concatenate(rhs)
+    ir["sense"] = np.array(["<"] * n_upper + ["="] * (offset - n_upper))
+
+
+# demand_bounds(ir,hospitals):
+#   right-hand sides of the demand rows for a hospitals table (read_demand
+#   format); the hospitals and horizon must match the ones the IR was built on
+# Returns -> float array, in demand family order
+def demand_bounds(ir,hospitals):
+    D = ir["n_days"] - 1
+    if [h[0] for h in hospitals] != ir["places"][ir["n_factories"]:] or len(hospitals[0]) != D + 1:
+        raise ValueError("hospitals do not match the model, rebuild it instead")
+    hosp, day, typ = grid(len(hospitals),D,len(DEMAND_TYPES))
+    demand = np.array([h[1:] for h in hospitals],dtype=float).reshape(len(hospitals),D)
+    return -demand[hosp,day]
+
+
+### Id arithmetic
+###     Map (material, place/arc, day) ids to global variable and constraint ids
+###     (-1 for entries dropped by the presolve); days are model days 1..n_days-1
+
+def x_id(ir,var,pair,day):
+    return global_id(family(ir["var_families"],var),(day - 1) * len(ir[var + "_pairs"]) + pair)
+
+# layout_arcs(ir):
+#   arcs in the layout of the z, s and shipped families; arcs added to a
+#   built model (updates.add_arc) come after these and have families of their own
+def layout_arcs(ir):
+    fam = family(ir["var_families"],"s")
+    return (len(fam["map"]) if "map" in fam else fam["size"]) // (ir["n_days"] - 1)
+
+def z_id(ir,mat,arc,day):
+    K, A = len(ir["materials"]), layout_arcs(ir)
+    return global_id(family(ir["var_families"],"z"),((day - 1) * A + arc) * K + mat)
+
+def s_id(ir,arc,day):
+    return global_id(family(ir["var_families"],"s"),(day - 1) * layout_arcs(ir) + arc)
+
+def M_id(ir,mat,place,day):
+    D = ir["n_days"] - 1
+    return global_id(family(ir["var_families"],"M"),(mat * len(ir["places"]) + place) * D + day - 1)
+
+def z0_id(ir,mat,rank):
+    return global_id(family(ir["var_families"],"z0"),rank * len(ir["materials"]) + mat)
+
+def manufacturing_id(ir,mat,fac,day):
+    D = ir["n_days"] - 1
+    return global_id(family(ir["constr_families"],"manufacturing"),(mat * len(ir["made"]) + fac) * D + day - 1)
+
+def demand_id(ir,typ,hosp,day):
+    D = ir["n_days"] - 1
+    return global_id(family(ir["constr_families"],"demand"),(hosp * D + day - 1) * len(DEMAND_TYPES) + typ)
+
+def availability_id(ir,mat,place,day):
+    K, D = len(ir["materials"]), ir["n_days"] - 1
+    return global_id(family(ir["constr_families"],"availability"),(place * D + day - 1) * K + mat)
+
+def capacities_id(ir,arc,day):
+    return global_id(family(ir["constr_families"],"capacities"),arc * (ir["n_days"] - 1) + day - 1)
+
+def onhand_id(ir,mat,place,day):
+    D = ir["n_days"] - 1
+    return global_id(family(ir["constr_families"],"onhand"),(mat * len(ir["places"]) + place) * D + day - 1)
+
+def shipped_id(ir,arc,day):
+    return global_id(family(ir["constr_families"],"shipped"),(day - 1) * layout_arcs(ir) + arc)
+
+# demand_type(ir,mat):
+#   0 for ppe, 1 for respirators (materials are resources + ppe + respirators)
+def demand_type(ir,mat):
+    return np.where(np.asarray(mat) < ir["n_resources"] + ir["n_ppe"],0,1)
+
+
+### Coefficients
+###     Each *_coefficients function mirrors the matching *_recipes function in
+###     format_data, returning (rows, cols, vals) with explicit zeros and
+###     entries on dropped variables left out
+
+# triplets(rows,cols,vals):
+#   packs coefficient lists into arrays, skipping dropped (-1) variables
+# Returns -> tuple of (int array, int array, float array)
+def triplets(rows,cols,vals):
+    rows = np.asarray(rows,dtype=np.int64).ravel()
+    cols = np.asarray(cols,dtype=np.int64).ravel()
+    vals = np.asarray(vals,dtype=float).ravel()
+    kept = cols >= 0
+    return rows[kept], cols[kept], vals[kept]
+
+# stack(blocks):
+#   concatenates (rows, cols, vals) blocks; vals may be a scalar per block
+# Returns -> tuple of (int array, int array, float array)
+def stack(blocks):
+    rows = [np.asarray(r,dtype=np.int64).ravel() for r,c,v in blocks]
+    cols = [np.asarray(c,dtype=np.int64).ravel() for r,c,v in blocks]
+    vals = [np.broadcast_to(np.asarray(v,dtype=float),r.shape) for r,(_,c,v) in zip(rows,blocks)]
+    if not rows:
+        return triplets([],[],[])
+    return triplets(np.concatenate(rows),np.concatenate(cols),np.concatenate(vals))
+
+# The flow-conservation blocks (onhand, demand, availability) are built over the
+# arc_start / arc_end arrays: each arc only touches the rows of its two endpoints,
+# so there is no scan over places per arc. The shipment entries are shared
+# with arcs added to a built model (updates.add_arc), through the *_shipments
+# helpers taking shipments z(mat, arc, day) in columns col
+
+# onhand_shipments(ir,mat,arc,day,col):
+#   shipments arrive and leave the stock of the next day; on a self-loop
+#   only the inflow entry is kept
+# Returns -> list of (rows, cols, vals) blocks
+def onhand_shipments(ir,mat,arc,day,col):
+    dummy = ir["dummy"]
+    keep = day < ir["n_days"] - 1
+    mat, day, col = mat[keep], day[keep], col[keep]
+    start, end = ir["arc_start"][arc[keep]], ir["arc_end"][arc[keep]]
+    out = (start != dummy) & (start != end)
+    into = end != dummy
+    return [(onhand_id(ir,mat[out],start[out],day[out] + 1),col[out],1),
+            (onhand_id(ir,mat[into],end[into],day[into] + 1),col[into],-1)]
+
+# demand_shipments(ir,mat,arc,day,col):
+#   equipment shipped out of / into a hospital counts against / towards the
+#   demand of the next day
+# Returns -> list of (rows, cols, vals) blocks
+def demand_shipments(ir,mat,arc,day,col):
+    F = ir["n_factories"]
+    keep = (day < ir["n_days"] - 1) & (mat >= ir["n_resources"])
+    mat, day, col = mat[keep], day[keep], col[keep]
+    start, end = ir["arc_start"][arc[keep]], ir["arc_end"][arc[keep]]
+    typ = demand_type(ir,mat)
+    out = (start >= F) & (start != end)
+    into = end >= F
+    return [(demand_id(ir,typ[out],start[out] - F,day[out] + 1),col[out],1),
+            (demand_id(ir,typ[into],end[into] - F,day[into] + 1),col[into],-1)]
+
+# availability_shipments(ir,mat,arc,day,col):
+#   shipments out of a place are limited by its stock that day
+# Returns -> list of (rows, cols, vals) blocks
+def availability_shipments(ir,mat,arc,day,col):
+    return [(availability_id(ir,mat,ir["arc_start"][arc],day),col,1)]
+
+# model_days(ir,days):
+#   the rows' model days a coefficient block is generated for: all days
+#   1..n_days-1, or only the given ones (e.g. one day block, see streaming.py)
+# Returns -> int array
+def model_days(ir,days=None):
+    return np.arange(1,ir["n_days"]) if days is None else np.asarray(days,dtype=np.int64)
+
+def onhand_coefficients(ir,days=None):
+    K, R, P = len(ir["materials"]), ir["n_resources"], len(ir["places"])
+    A, dummy = len(ir["arc_start"]), ir["dummy"]
+    days = model_days(ir,days)
+    later = days[days > 1]
+    blocks = []
+    # factories only - subtract used for equipment, add equipment made
+    for var in ("x","y"):
+        pairs = ir[var + "_pairs"]
+        pair, res = np.nonzero(ir["recipe"][pairs[:,1],:R])
+        day, i = grid(len(later),len(pair))
+        day = later[day]
+        blocks.append((onhand_id(ir,res[i],pairs[pair[i],0],day),
+                       x_id(ir,var,pair[i],day - 1),
+                       ir["recipe"][pairs[pair[i],1],res[i]]))
+        day, pair = grid(len(days),len(pairs))
+        day = days[day]
+        blocks.append((onhand_id(ir,pairs[pair,1],pairs[pair,0],day),x_id(ir,var,pair,day),-1))
+    # all places; stock today and carried over from yesterday
+    mat, place, day = grid(K,P,len(days))
+    day = days[day]
+    blocks.append((onhand_id(ir,mat,place,day),M_id(ir,mat,place,day),1))
+    keep = (day > 1) & (place != dummy)
+    blocks.append((onhand_id(ir,mat[keep],place[keep],day[keep]),M_id(ir,mat[keep],place[keep],day[keep] - 1),-1))
+    # shipped out / in yesterday
+    day, arc, mat = grid(len(later),A,K)
+    day = later[day] - 1
+    blocks += onhand_shipments(ir,mat,arc,day,z_id(ir,mat,arc,day))
+    return stack(blocks)
+
+def demand_coefficients(ir,days=None):
+    K, R, F = len(ir["materials"]), ir["n_resources"], ir["n_factories"]
+    A, H = len(ir["arc_start"]), len(ir["places"]) - F
+    days = model_days(ir,days)
+    later = days[days > 1]
+    blocks = []
+    # hospital shipped out / in yesterday, equipment only
+    day, arc, mat = grid(len(later),A,K - R)
+    day, mat = later[day] - 1, mat + R
+    blocks += demand_shipments(ir,mat,arc,day,z_id(ir,mat,arc,day))
+    # dummy reserve shipments on day 0 count towards day 1
+    if (days == 1).any():
+        rank, mat = grid(len(ir["dummy_arcs"]),K - R)
+        mat = mat + R
+        end = ir["arc_end"][ir["dummy_arcs"][rank]]
+        into = end >= F
+        blocks.append((demand_id(ir,demand_type(ir,mat[into]),end[into] - F,1),z0_id(ir,mat[into],rank[into]),-1))
+    # equipment on hand yesterday
+    mat, hosp, day = grid(K - R,H,len(later))
+    day, mat = later[day], mat + R
+    blocks.append((demand_id(ir,demand_type(ir,mat),hosp,day),M_id(ir,mat,hosp + F,day - 1),-1))
+    return stack(blocks)
+
+def availability_coefficients(ir,days=None):
+    K, P, A = len(ir["materials"]), len(ir["places"]), len(ir["arc_start"])
+    days = model_days(ir,days)
+    day, arc, mat = grid(len(days),A,K)
+    day = days[day]
+    shipped = availability_shipments(ir,mat,arc,day,z_id(ir,mat,arc,day))
+    mat, place, day = grid(K,P,len(days))
+    day = days[day]
+    onhand = (availability_id(ir,mat,place,day),M_id(ir,mat,place,day),-1)
+    return stack(shipped + [onhand])
+
+def manufacturing_coefficients(ir,days=None):
+    R = ir["n_resources"]
+    days = model_days(ir,days).tolist()
+    fac_of = {p:i for i,p in enumerate(ir["made"])}
+    rows, cols, vals = [], [], []
+    for var in ("x","y"):
+        for pair,(place,equip) in enumerate(ir[var + "_pairs"]):
+            if place not in fac_of:
+                continue
+            for r in np.flatnonzero(ir["recipe"][equip,:R]):
+                for day in days:
+                    rows.append(manufacturing_id(ir,r,fac_of[place],day))
+                    cols.append(x_id(ir,var,pair,day))
+                    vals.append(ir["recipe"][equip,r])
+    for r in range(R):
+        for fac,place in enumerate(ir["made"]):
+            for day in days:
+                rows.append(manufacturing_id(ir,r,fac,day))
+                cols.append(M_id(ir,r,place,day))
+                vals.append(-1)
+    return triplets(rows,cols,vals)
+
+def total_shipped_coefficients(ir,days=None):
+    K, A = len(ir["materials"]), len(ir["arc_start"])
+    days = model_days(ir,days)
+    day, arc, mat = grid(len(days),A,K)
+    day = days[day]
+    z_rows = shipped_id(ir,arc,day)
+    z_cols = z_id(ir,mat,arc,day)
+    day, arc = grid(len(days),A)
+    day = days[day]
+    s_rows = shipped_id(ir,arc,day)
+    s_cols = s_id(ir,arc,day)
+    return triplets(np.concatenate([z_rows,s_rows]),np.concatenate([z_cols,s_cols]),
+                    np.concatenate([np.ones(len(z_rows)),-np.ones(len(s_rows))]))
+
+def shipping_cap_coefficients(ir,days=None):
+    days = model_days(ir,days)
+    day, arc = grid(len(days),len(ir["arc_start"]))
+    day = days[day]
+    return triplets(capacities_id(ir,arc,day),s_id(ir,arc,day),np.ones(len(arc)))
+
+# the coefficient blocks, in the same order as gen_recipes
+COEFFICIENTS = [shipping_cap_coefficients,
+                total_shipped_coefficients,
+                demand_coefficients,
+                availability_coefficients,
+                onhand_coefficients,
+                manufacturing_coefficients]
+
+# gen_coefficients(ir):
+#   combines all coefficient blocks
+# Returns -> None, fills ir["rows"], ir["cols"] and ir["vals"]
+def gen_coefficients(ir):
+    blocks = [profiling.call(fn,ir) for fn in COEFFICIENTS]
+    ir["rows"] = np.concatenate([b[0] for b in blocks])
+    ir["cols"] = np.concatenate([b[1] for b in blocks])
+    ir["vals"] = np.concatenate([b[2] for b in blocks])
+
+# day_coefficients(ir,days):
+#   all coefficients of the rows of the given model days; every row belongs
+#   to exactly one day, so day blocks partition the matrix by rows
+# Returns -> tuple of (int array, int array, float array)
+def day_coefficients(ir,days):
+    blocks = [fn(ir,days) for fn in COEFFICIENTS]
+    return tuple(np.concatenate([b[k] for b in blocks]) for k in range(3))
+
+# day_blocks(ir,block_days):
+#   model days 1..n_days-1 in consecutive blocks of block_days
+# Returns -> generator of int arrays
+def day_blocks(ir,block_days):
+    last = ir["n_days"] - 1
+    for first in range(1,last + 1,block_days):
+        yield np.arange(first,min(first + block_days,last + 1))
+
+### Names
+###     Only produced on request, e.g. when writing the LP file or the results
+
+# label(ir,field,i):
+#   human-readable value of one index field
+def label(ir,field,i):
+    if field == "material":
+        return ir["materials"][i]
+    if field == "place":
+        return ir["places"][i]
+    if field == "arc":
+        return "{}->{}".format(ir["places"][ir["arc_start"][i]],ir["places"][ir["arc_end"][i]])
+    if field == "type":
+        return DEMAND_TYPES[i]
+    return int(i)
+
+# locate(families,j):
+#   family block holding global id j
+# Returns -> (family dict, position within the family)
+def locate(families,j):
+    offsets = [fam["offset"] for fam in families]
+    fam = families[bisect.bisect_right(offsets,j) - 1]
+    while fam["size"] == 0 or j >= fam["offset"] + fam["size"]:
+        fam = families[families.index(fam) + 1]
+    return fam, j - fam["offset"]
+
+def family_names(ir,fam):
+    cols = [[label(ir,f,i) for i in fam["index"][f]] for f in fam["fields"]]
+    return [fam["template"].format(*vals) for vals in zip(*cols)]
+
+def var_name(ir,j):
+    fam, pos = locate(ir["var_families"],j)
+    return fam["template"].format(*[label(ir,f,fam["index"][f][pos]) for f in fam["fields"]])
+
+def constr_name(ir,i):
+    fam, pos = locate(ir["constr_families"],i)
+    return fam["template"].format(*[label(ir,f,fam["index"][f][pos]) for f in fam["fields"]])
+
+def var_names(ir):
+    return [name for fam in ir["var_families"] for name in family_names(ir,fam)]
+
+def constr_names(ir):
+    return [name for fam in ir["constr_families"] for name in family_names(ir,fam)]
+
+
+### Checks
+
+# compare_with_dicts(ir,decision_vars,objective,recipes,upper_bounds,equalities):
+#   compares the IR with the dict-based model from format_data, entry by entry:
+#   variable and constraint names/order, senses, right-hand sides, objective and
+#   coefficients; recipes on unknown variables/constraints and zero coefficients
+#   are ignored, as they never reach the solver
+# Returns -> list of str describing the mismatches (empty when identical)
+def compare_with_dicts(ir,decision_vars,objective,recipes,upper_bounds,equalities):
+    problems = []
+    names = var_names(ir)
+    rows = constr_names(ir)
+    if names != list(decision_vars):
+        problems.append("variables differ")
+    if rows != list(upper_bounds.keys()) + list(equalities.keys()):
+        problems.append("constraints differ")
+    if problems:
+        return problems
+
+    if list(ir["sense"]) != ["<"] * len(upper_bounds) + ["="] * len(equalities):
+        problems.append("constraint senses differ")
+    rhs = np.array(list(upper_bounds.values()) + list(equalities.values()),dtype=float)
+    for i in np.flatnonzero(rhs != ir["rhs"]):
+        problems.append("rhs of {}: {} != {}".format(rows[i],ir["rhs"][i],rhs[i]))
+
+    obj = {names[j]:ir["obj"][j] for j in np.flatnonzero(ir["obj"])}
+    if obj != {k:v for k,v in objective.items() if v != 0}:
+        problems.append("objective differs")
+
+    known_vars, known_rows = set(names), set(rows)
+    expected = {k:v for k,v in recipes.items() if v != 0 and k[0] in known_vars and k[1] in known_rows}
+    found = {}
+    for r,c,v in zip(ir["rows"],ir["cols"],ir["vals"]):
+        key = (names[c],rows[r])
+        if key in found:
+            problems.append("duplicate coefficient {}".format(key))
+        found[key] = v
+    for key in set(expected) | set(found):
+        if expected.get(key) != found.get(key):
+            problems.append("coefficient {}: {} != {}".format(key,found.get(key),expected.get(key)))
+    return problems
@@ -0,0 +1,226 @@
+#%%
+import argparse
+import importlib
+import time
+import numpy as np
+import format_data
+import model_ir
+
+"""
+Fast feasibility pre-check on the parsed inputs
+
+Before a long MIP solve, a few bounds that take milliseconds tell whether the
+plan will lean on the DUMMY_RESERVE arcs (cost 1e9 per unit), and where:
+- production: for each equipment type (ppe, respirators), the most units the
+              factories' pooled resources can make (an LP over the recipes,
+              equipment a factory can make only), against the peak network
+              demand of that type
+- reach:      for each hospital, the max-flow from all factories over the
+              non-dummy arcs (units per day) and the fewest arcs from a
+              factory; by day d it can have received at most
+              flow x (d - hops) units. Reserve units persist and can move
+              between hospitals, so the shortfalls of all hospitals add up
+              on one day only: the bound is the largest daily sum
+Day-1 demand is met by the free day-0 reserve shipments, and equipment at a
+hospital is not used up, so from day 2 on the stock of each type at a
+hospital must cover that day's demand. Both checks give a lower bound on the
+units the plan must take from the reserve, the larger one a lower bound on
+the objective.
+
+    python precheck.py [--data DIR] [--verify BACKEND]
+
+exits with 1 when reserve use is certain (or the model infeasible). --verify
+also solves the model and fails if a bound is above the optimum; the
+instances in data/regression are kept for this, e.g.
+
+    python precheck.py --data ../data/regression/shared_reserve --verify highs
+
+(reserve units shared by two hospitals on different days, bound 200 units).
+"""
+
+
+# equipment_types(data):
+#   equipment names of each demand type, as model_ir.DEMAND_TYPES
+# Returns -> dict of type -> list of str
+def equipment_types(data):
+    return {"ppe":list(data["ppe"]),"respirators":list(data["respirators"])}
+
+# needed_days(data):
+#   demand per hospital and day from day 2 on (day 1 is covered by the
+#   day-0 reserve shipments)
+# Returns -> (list of hospital names, array [hospital, day] for days 2..)
+def needed_days(data):
+    names = [h[0] for h in data["hospitals"]]
+    demand = np.array([h[1:] for h in data["hospitals"]],dtype=float).reshape(len(names),-1)
+    return names, demand[:,1:]
+
+# production_bounds(data):
+#   most units of each equipment type the resources at all real factories
+#   can make, and the resources that limit it (tight in the LP)
+# Returns -> dict of type -> (float, list of str)
+def production_bounds(data):
+    from scipy.optimize import linprog
+
+    factories = {f:v for f,v in data["factories"].items() if f != model_ir.DUMMY}
+    resources = data["resources"]
+    stock = np.array([sum(v.get(r,0) for v in factories.values()) for r in resources])
+    bounds = {}
+    for typ,names in equipment_types(data).items():
+        book = data["ppe"] if typ == "ppe" else data["respirators"]
+        made = [e for e in names if any(e in v for v in factories.values())]
+        if not made:
+            bounds[typ] = (0.0,[])
+            continue
+        recipe = np.array([[book[e].get(r,0) for e in made] for r in resources]).reshape(len(resources),len(made))
+        if (recipe.sum(axis=0) == 0).any():
+            bounds[typ] = (np.inf,[])
+            continue
+        res = linprog(-np.ones(len(made)),A_ub=recipe,b_ub=stock,bounds=(0,None),method="highs")
+        tight = np.flatnonzero(res.ineqlin.marginals < 0)
+        bounds[typ] = (max(0.0,-res.fun),[resources[r] for r in tight])
+    return bounds
+
+# reach(data):
+#   per hospital, max-flow from the real factories over the non-dummy arcs
+#   (arc capacities are per day) and fewest arcs from a factory
+# Returns -> (float array of flows, float array of hops, inf if unreachable)
+def reach(data):
+    import scipy.sparse as sp
+    from scipy.sparse.csgraph import maximum_flow, shortest_path
+
+    factories = [f for f in data["factories"] if f != model_ir.DUMMY]
+    places = factories + [h[0] for h in data["hospitals"]]
+    place_id = {p:i for i,p in enumerate(places)}
+    arcs = [(place_id[s],place_id[e],cap) for s,e,cap,cost in data["shipping"]
+            if s in place_id and e in place_id and s != e]
+    # node n is a source feeding every factory
+    n, big = len(places), 2**30
+    start = np.array([a[0] for a in arcs] + [n] * len(factories),dtype=np.int64)
+    end = np.array([a[1] for a in arcs] + list(range(len(factories))),dtype=np.int64)
+    cap = np.minimum(np.ceil([a[2] for a in arcs] + [big] * len(factories)),big).astype(np.int32)
+    graph = sp.csr_matrix((cap,(start,end)),shape=(n + 1,n + 1))
+    graph.sum_duplicates()
+
+    hospitals = range(len(factories),n)
+    hops = shortest_path(graph,unweighted=True,indices=n)[len(factories):n] - 1
+    flows = np.array([maximum_flow(graph,n,h).flow_value if np.isfinite(hops[h - len(factories)]) else 0
+                      for h in hospitals],dtype=float)
+    return flows, hops
+
+# check(data):
+#   runs the bounds on parsed inputs (format_data.read_inputs)
+# Returns -> dict of types (per type: need, peak day, supply, limiting
+#            resources, reserve bound), hospitals (per hospital: flow, hops,
+#            reserve bound, worst day), network (largest daily sum of the
+#            hospital shortfalls and its day), reserve and objective lower bounds,
+#            missing (types without any equipment: the model is infeasible)
+#            and time
+def check(data):
+    # scipy is imported (once per process) before the check is timed
+    for module in ("scipy.optimize","scipy.sparse.csgraph"):
+        importlib.import_module(module)
+    start = time.perf_counter()
+    names, demand = needed_days(data)
+    days = np.arange(2,2 + demand.shape[1])
+    if not len(days):
+        demand, days = np.zeros((len(names),1)), np.array([2])
+
+    totals = demand.sum(axis=0)
+    peak = int(np.argmax(totals))
+    types = {}
+    for typ,(supply,limits) in production_bounds(data).items():
+        types[typ] = {"need":float(totals[peak]),"day":int(days[peak]),"supply":float(supply),"limits":limits,
+                      "reserve":float(max(0.0,totals[peak] - supply))}
+
+    # every hospital needs its demand in each type on hand; reserve units
+    # persist and move between hospitals, so the shortfalls only add up
+    # within one day
+    flows, hops = reach(data)
+    hospitals = {}
+    short = np.zeros((len(names),len(days)))
+    for h,name in enumerate(names):
+        arrived = flows[h] * np.maximum(0,days - hops[h]) if np.isfinite(hops[h]) else 0
+        short[h] = np.maximum(0,len(model_ir.DEMAND_TYPES) * demand[h] - arrived)
+        worst = int(np.argmax(short[h]))
+        hospitals[name] = {"flow":float(flows[h]),"hops":float(hops[h]),
+                           "reserve":float(short[h,worst]),"day":int(days[worst])}
+    worst = int(np.argmax(short.sum(axis=0)))
+    network = {"reserve":float(short[:,worst].sum()),"day":int(days[worst])}
+
+    reserve = max(sum(t["reserve"] for t in types.values()),network["reserve"])
+    costs = [cost for s,e,cap,cost in data["shipping"] if s == model_ir.DUMMY and e in hospitals]
+    return {"types":types,"hospitals":hospitals,"network":network,"reserve":reserve,
+            "objective":reserve * min(costs) if costs else 0.0,
+            "missing":[typ for typ,equip in equipment_types(data).items() if not equip],
+            "time":time.perf_counter() - start}
+
+# report(result):
+#   bottlenecks found by check, one line each
+# Returns -> str
+def report(result):
+    lines = ["Pre-check ({:.1f} ms):".format(result["time"] * 1000)]
+    for typ,t in result["types"].items():
+        line = "    {}: peak demand {:,.0f} (day {}), factories can make at most {:,.0f}".format(
+            typ,t["need"],t["day"],t["supply"])
+        if t["limits"]:
+            line += " (limited by {})".format(", ".join(t["limits"]))
+        if t["reserve"] > 0:
+            line += " -> at least {:,.0f} from {}".format(t["reserve"],model_ir.DUMMY)
+        lines.append(line)
+    short = {name:h for name,h in result["hospitals"].items() if h["reserve"] > 0}
+    for name,h in sorted(short.items(),key=lambda item: -item[1]["reserve"]):
+        reach_ = "unreachable" if not np.isfinite(h["hops"]) else "max flow {:,.0f}/day, {:.0f} arcs away".format(h["flow"],h["hops"])
+        lines.append("    {}: {} -> at least {:,.0f} from {} by day {}".format(
+            name,reach_,h["reserve"],model_ir.DUMMY,h["day"]))
+    lines.append("    {} of {} hospitals can be fully supplied by the network".format(
+        len(result["hospitals"]) - len(short),len(result["hospitals"])))
+    if result["network"]["reserve"] > 0:
+        lines.append("    all hospitals: at least {:,.0f} from {} on hand on day {}".format(
+            result["network"]["reserve"],model_ir.DUMMY,result["network"]["day"]))
+    for typ in result["missing"]:
+        lines.append("No {} equipment at all: the {} demand cannot be met, the model is infeasible".format(typ,typ))
+    if result["reserve"] > 0:
+        lines.append("{} use: at least {:,.0f} units, objective at least {:,.0f}".format(
+            model_ir.DUMMY,result["reserve"],result["objective"]))
+    else:
+        lines.append("No {} use forced by supply or network capacity".format(model_ir.DUMMY))
+    return "\n".join(lines)
+
+# verify(data,result,backend):
+#   solves the model with a backend (see backends.py) and checks the bounds
+#   of check(data) against the optimum
+# Returns -> list of str, the bounds above the optimum (empty when sound)
+def verify(data,result,backend="highs"):
+    import backends
+    solution = format_data.solve(format_data.build_model(data=data),backend=backend)
+    if backend == "gurobi":
+        status, objective = backends.gurobi_status(solution), solution.ObjVal if solution.SolCount else None
+    else:
+        status, objective = solution.status, solution.objective
+    if status != "optimal":
+        return ["{} did not solve the model to optimality ({})".format(backend,status)]
+    if result["objective"] > objective + 1e-9 * abs(objective) + 1e-6:
+        return ["objective bound {:,.2f} ({:,.0f} {} units) is above the optimum {:,.2f}".format(
+            result["objective"],result["reserve"],model_ir.DUMMY,objective)]
+    return []
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check supply and network capacity against demand before solving")
+    parser.add_argument("--data",default=format_data.DATA_DIR,help="directory holding the input csvs")
+    parser.add_argument("--no-cache",action="store_true",help="parse the csvs even if a cached copy exists")
+    parser.add_argument("--verify",choices=["gurobi","highs","scipy"],help="also solve the model with this backend and check the bounds against the optimum")
+    args = parser.parse_args(argv)
+
+    data = format_data.read_inputs(args.data,None if args.no_cache else format_data.CACHE_DIR)
+    result = check(data)
+    print(report(result))
+    if args.verify:
+        problems = verify(data,result,args.verify)
+        for p in problems:
+            print(p)
+        print("{} unsound bounds".format(len(problems)))
+        return 1 if problems else 0
+    return 1 if result["reserve"] > 0 or result["missing"] else 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,122 @@
+#%%
+import numpy as np
+import model_ir
+
+"""
+Network presolve on the shipping graph
+
+Every material gets a z variable on every arc on every day, and every
+material an M variable at every place, although most of them can never be
+nonzero or never matter. Before the variables are generated, two day bounds
+are computed per (material, place) by propagating along the arcs (a shipment
+takes one day):
+- earliest: first day the material can be at the place at all; sources are
+            day-1 factory stock, factories making the equipment (from the day
+            all its resources can be there) and the dummy reserve
+- latest:   last day the material being at the place can still matter;
+            sinks are hospitals for equipment, and factories using the resource
+            in something they make (as long as that equipment still matters)
+
+Then
+- z(m, u->v, d) is kept only if earliest(m,u) <= d and d+1 <= latest(m,v)
+- s(u->v, d) only if some z on that arc and day is kept
+- M(m, p, d) only if earliest(m,p) <= d
+- day-0 dummy z only for equipment going to hospitals
+Variables below "earliest" are zero in every feasible solution, and a
+shipment that arrives too late (or where the material is never used) can be
+left out of an optimal plan as shipping costs are not negative. Rows that end
+up empty (and hold for all-zero variables) are dropped after generation.
+"""
+
+
+# earliest_days(ir):
+#   first day each material can be at each place (inf if never)
+# Returns -> array [material, place]
+def earliest_days(ir):
+    R, start, end = ir["n_resources"], ir["arc_start"], ir["arc_end"]
+    earliest = np.where(ir["stock"] > 0,1.0,np.inf)
+    pairs = np.concatenate([ir["x_pairs"],ir["y_pairs"]])
+    while True:
+        before = earliest.copy()
+        # equipment can be made once every resource of its recipe can be there
+        for place,equip in pairs:
+            used = ir["recipe"][equip,:R] > 0
+            ready = earliest[:R,place][used].max() if used.any() else 1.0
+            earliest[equip,place] = min(earliest[equip,place],ready)
+        np.minimum.at(earliest.T,end,(earliest[:,start] + 1).T)
+        if np.array_equal(before,earliest):
+            return earliest
+
+# latest_days(ir):
+#   last day each material being at each place can still matter (-inf if never)
+# Returns -> array [material, place]
+def latest_days(ir):
+    R, F, start, end = ir["n_resources"], ir["n_factories"], ir["arc_start"], ir["arc_end"]
+    latest = np.full(ir["stock"].shape,-np.inf)
+    latest[R:,F:] = ir["n_days"] - 1
+    pairs = np.concatenate([ir["x_pairs"],ir["y_pairs"]])
+    while True:
+        before = latest.copy()
+        # resources matter at a factory as long as what they make there does
+        for place,equip in pairs:
+            used = ir["recipe"][equip,:R] > 0
+            latest[:R,place][used] = np.maximum(latest[:R,place][used],latest[equip,place])
+        np.maximum.at(latest.T,start,(latest[:,end] - 1).T)
+        if np.array_equal(before,latest):
+            return latest
+
+# feasible_vars(ir):
+#   masks over the full layout of the z, s, M and day-0 z families
+# Returns -> dict of family name -> bool array
+def feasible_vars(ir):
+    K, R, F = len(ir["materials"]), ir["n_resources"], ir["n_factories"]
+    P, A, D = len(ir["places"]), len(ir["arc_start"]), ir["n_days"] - 1
+    earliest, latest = earliest_days(ir), latest_days(ir)
+
+    day, arc, mat = model_ir.grid(D,A,K)
+    day = day + 1
+    z = (earliest[mat,ir["arc_start"][arc]] <= day) & (day + 1 <= latest[mat,ir["arc_end"][arc]])
+    s = z.reshape(D,A,K).any(axis=2).ravel()
+    mat, place, day = model_ir.grid(K,P,D)
+    M = earliest[mat,place] <= day + 1
+    rank, mat = model_ir.grid(len(ir["dummy_arcs"]),K)
+    z0 = (mat >= R) & (ir["arc_end"][ir["dummy_arcs"][rank]] >= F)
+
+    keep = {"z":z,"s":s,"M":M,"z0":z0}
+    ir["presolve"] = {"vars":{name:(len(mask),int(np.count_nonzero(mask))) for name,mask in keep.items()}}
+    return keep
+
+# drop_empty_rows(ir,counts):
+#   drops constraints left without coefficients that hold for all-zero
+#   variables, renumbering the remaining rows; counts (coefficients per row)
+#   is taken from ir["rows"] unless given, e.g. by streaming.write_matrix
+# Returns -> bool array of the rows kept, updates ir in place
+def drop_empty_rows(ir,counts=None):
+    if counts is None:
+        counts = np.bincount(ir["rows"],minlength=ir["n_constrs"])
+    holds = np.where(ir["sense"] == "<",ir["rhs"] >= 0,ir["rhs"] == 0)
+    keep = (counts > 0) | ~holds
+
+    stats, offset = {}, 0
+    for fam in ir["constr_families"]:
+        mask = keep[fam["offset"]:fam["offset"] + fam["size"]]
+        stats[fam["name"]] = (fam["size"],int(np.count_nonzero(mask)))
+        offset = model_ir.compact_family(fam,mask,offset)
+    if "rows" in ir:
+        ir["rows"] = (np.cumsum(keep) - 1)[ir["rows"]]
+    ir["rhs"], ir["sense"] = ir["rhs"][keep], ir["sense"][keep]
+    ir["n_constrs"] = offset
+    ir.setdefault("presolve",{})["constrs"] = stats
+    return keep
+
+# report(ir):
+#   one line per family with the entries kept by the presolve
+# Returns -> str
+def report(ir):
+    lines = []
+    for kind,total in (("variables",ir["n_vars"]),("constraints",ir["n_constrs"])):
+        stats = ir.get("presolve",{}).get("vars" if kind == "variables" else "constrs",{})
+        eliminated = sum(b - a for b,a in stats.values())
+        lines.append("Presolve: {:,} of {:,} {} kept ({:,} eliminated)".format(total,total + eliminated,kind,eliminated))
+        lines += ["    {}: {:,} of {:,}".format(name,a,b) for name,(b,a) in stats.items() if a != b]
+    return "\n".join(lines)
@@ -0,0 +1,147 @@
+#%%
+import contextlib
+import json
+import time
+import tracemalloc
+import numpy as np
+
+"""
+Stage-level instrumentation of the build and solve
+
+Off by default; every hook is a no-op until enable() is called. Once enabled,
+records (dicts) are collected and can be written as JSON lines:
+- span:     wall time (and with memory=True, peak traced memory) of a stage,
+            e.g. one *_recipes generator or the IR coefficient blocks; spans
+            nest, depth gives the level
+- family:   variable / constraint count and nonzeros of each ir family
+- progress: Gurobi incumbent, bound and gap over time, from a MIP callback
+With cprofile=FILE, a cProfile of everything between enable() and disable()
+is written to FILE as well.
+
+    profiling.enable(memory=True)
+    spec = format_data.build_model()
+    m = format_data.solve(spec)
+    profiling.write_jsonl("profile.jsonl")
+"""
+
+state = {"records":None,"start":0.0,"memory":False,"stack":[],"profiler":None,"cprofile":None}
+
+
+def enabled():
+    return state["records"] is not None
+
+# enable(memory,cprofile):
+#   starts collecting records; memory traces allocations (slower), cprofile
+#   names a file for cProfile stats written by disable()
+def enable(memory=False,cprofile=None):
+    state.update(records=[],start=time.perf_counter(),memory=memory,stack=[],cprofile=cprofile)
+    if memory:
+        tracemalloc.start()
+    if cprofile:
+        import cProfile
+        state["profiler"] = cProfile.Profile()
+        state["profiler"].enable()
+
+# disable():
+#   stops collecting (and writes the cProfile stats)
+# Returns -> list of records collected
+def disable():
+    records = state["records"] or []
+    if state["profiler"] is not None:
+        state["profiler"].disable()
+        state["profiler"].dump_stats(state["cprofile"])
+    if state["memory"]:
+        tracemalloc.stop()
+    state.update(records=None,profiler=None,memory=False)
+    return records
+
+def record(event,**fields):
+    if enabled():
+        state["records"].append({"event":event,"at":time.perf_counter() - state["start"],**fields})
+
+# span(name,**fields):
+#   context manager recording the wall time (and peak memory) of a stage
+@contextlib.contextmanager
+def span(name,**fields):
+    if not enabled():
+        yield
+        return
+    stack = state["stack"]
+    if state["memory"]:
+        # the peak of an enclosing span is kept on the stack while this one runs
+        if stack:
+            stack[-1] = max(stack[-1],tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    stack.append(0)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        peak = stack.pop()
+        if state["memory"]:
+            peak = max(peak,tracemalloc.get_traced_memory()[1])
+            if stack:
+                stack[-1] = max(stack[-1],peak)
+            tracemalloc.reset_peak()
+        rec = {"name":name,"depth":len(stack),"time":elapsed,**fields}
+        if state["memory"]:
+            rec["peak_mb"] = peak / 2**20
+        record("span",**rec)
+
+# call(fn,*args):
+#   fn(*args) inside a span named after fn; the size of the result (of its
+#   first element for a tuple, e.g. the rows of coefficient triplets) is
+#   recorded as entries
+def call(fn,*args):
+    if not enabled():
+        return fn(*args)
+    with span(fn.__name__):
+        result = fn(*args)
+    state["records"][-1]["entries"] = len(result[0] if isinstance(result,tuple) else result)
+    return result
+
+# count_families(ir):
+#   records size and nonzeros of every variable and constraint family
+def count_families(ir):
+    if not enabled():
+        return
+    for kind,families,index in (("var",ir["var_families"],ir["cols"]),("constr",ir["constr_families"],ir["rows"])):
+        nonzeros = np.bincount(index,minlength=sum(fam["size"] for fam in families))
+        for fam in families:
+            record("family",kind=kind,name=fam["name"],size=fam["size"],
+                   nonzeros=int(nonzeros[fam["offset"]:fam["offset"] + fam["size"]].sum()))
+
+# progress_callback(model,where):
+#   Gurobi callback recording incumbent, bound and gap whenever one of them
+#   changes (at most every 0.1s of solver time)
+def progress_callback(model,where):
+    from gurobipy import GRB
+    if where != GRB.Callback.MIP:
+        return
+    runtime = model.cbGet(GRB.Callback.RUNTIME)
+    best, bound = model.cbGet(GRB.Callback.MIP_OBJBST), model.cbGet(GRB.Callback.MIP_OBJBND)
+    last = getattr(model,"_progress",None)
+    if last is not None and ((best,bound) == last[1:] or runtime - last[0] < 0.1):
+        return
+    model._progress = (runtime,best,bound)
+    gap = abs(best - bound) / abs(best) if best < GRB.INFINITY and best != 0 else None
+    record("progress",runtime=runtime,incumbent=best if best < GRB.INFINITY else None,
+           bound=bound if abs(bound) < GRB.INFINITY else None,gap=gap,
+           nodes=model.cbGet(GRB.Callback.MIP_NODCNT))
+
+# optimize(m):
+#   m.optimize(), with the progress callback and a span while enabled
+def optimize(m):
+    if not enabled():
+        m.optimize()
+        return
+    with span("optimize"):
+        m.optimize(progress_callback)
+
+# write_jsonl(fname,records):
+#   writes records (default: the ones collected so far) as JSON lines
+def write_jsonl(fname,records=None):
+    with open(fname,"w") as f:
+        for rec in state["records"] if records is None else records:
+            f.write(json.dumps(rec) + "\n")
@@ -1,10 +1,11 @@
 # REQUIRED PACKAGES
 # UNCOMMENT ON FIRST RUN OF FILE IF YOU DON'T HAVE THESE PACKAGES
 # !pip install csv
-# !pip install json
 #%%
 import csv
-import json 
+import hashlib
+import os
+import pickle
 
 """ 
 Functions to read in data from csvs 
@@ -17,74 +18,122 @@ Each function needs the relative path to the csv file as input
                 NOTE: output will be adjusted to whatever is easiest for Gurobi inputs
 - read_shipping: just used for shipping paths, reads csv, outputs list of lists
                 NOTE: output will be adjusted to whatever is easiest for Gurobi inputs
+- read_cached: runs one of the above through a pickle cache keyed by the
+               file's hash, so unchanged files are not parsed again
+Every file is parsed in one pass; a cell that does not fit the file's layout
+raises a ValueError naming the file, line and column
 There are additional helper functions to read and clean data
 """
 
-# strips and casts all eligible elements in an array (float and string)
-def traverse_cast(list_of_lists: list):
-    cleaned = []
-    for row in list_of_lists:
-        new_row = []
-        for i in row:
-            try:
-                new_row.append(float(str(i).strip()))
-            except:
-                new_row.append(i.strip())
-        cleaned.append(new_row)
-    return cleaned
-
-# reads in data from csv, strips strings, and casts all numbers to float
-# empty rows are removed
-def clean_read(fname:str):
-    with open(fname,encoding="utf-8-sig") as csvfile:
-        data = list(csv.reader(csvfile))
-    return [i for i in traverse_cast(data) if i!=[]]
+CACHE_VERSION = 1
+
+# stripped_rows(fname):
+#   yields (line number, stripped cells) of every non-blank row; trailing
+#   empty cells are dropped
+def stripped_rows(fname:str):
+    with open(fname,encoding="utf-8-sig",newline="") as csvfile:
+        for line,row in enumerate(csv.reader(csvfile),start=1):
+            row = [cell.strip() for cell in row]
+            while row and row[-1] == "":
+                row.pop()
+            if row:
+                yield line,row
+
+# to_float(fname,line,col,cell):
+#   casts one cell to float, blank cells to 0 if blank is given
+# Raises -> ValueError with the position of a bad cell
+def to_float(fname,line,col,cell,blank=None):
+    if cell == "" and blank is not None:
+        return blank
+    try:
+        return float(cell)
+    except ValueError:
+        raise ValueError("{}:{}: column {}: expected a number, got {!r}".format(fname,line,col + 1,cell)) from None
+
+# to_name(fname,line,col,cell):
+#   checks that a cell holds a name
+# Raises -> ValueError with the position of a blank cell
+def to_name(fname,line,col,cell):
+    if cell == "":
+        raise ValueError("{}:{}: column {}: expected a name, got a blank cell".format(fname,line,col + 1))
+    return cell
 
 # reads csv and returns dictionary of contents
+# rows are a name followed by (name, number) pairs
 # use for: respirators, factories, ppe
 def read_cost_values(csv_name: str):
-    cleaned = clean_read(csv_name)
-    return {row[0]: {row[i]:row[i+1] for i in range(1,len(row)-1,2)} for row in cleaned}
+    values = {}
+    for line,row in stripped_rows(csv_name):
+        if len(row) % 2 != 1:
+            raise ValueError("{}:{}: expected a name followed by (name, number) pairs".format(csv_name,line))
+        values[to_name(csv_name,line,0,row[0])] = {to_name(csv_name,line,i,row[i]):to_float(csv_name,line,i + 1,row[i + 1])
+                                                    for i in range(1,len(row),2)}
+    return values
 
 # reads csv and returns list of contents
 # use for: resources
 def read_list(csv_name: str):
-    cleaned = clean_read(csv_name)
-    combined = []
-    for row in cleaned:
-        combined = combined + row
-    return sorted(combined)
-
-# reads csv and returns pandas df (for now) 
-# replace blanks with 0s
+    return sorted(to_name(csv_name,line,i,cell) for line,row in stripped_rows(csv_name) for i,cell in enumerate(row))
+
+# reads csv and returns list of lists, [name, demand day 1, day 2, ...]
+# replace blanks with 0s, shorter rows are padded with 0s
 # use for: hospitals
 def read_demand(csv_name: str):
-    cleaned = clean_read(csv_name)
-    n_days = max([len(i) for i in cleaned]) # -1
-    for i in range(len(cleaned)):
-        cleaned[i] = [j if j!='' else 0 for j in cleaned[i]]
-        cleaned[i] = cleaned[i] + [0]*(n_days-len(cleaned[i]))
-    # {row[0]: row[1:] + ([0] * (n_days-len(row)+1)) for row in cleaned}
-    return cleaned
+    cleaned = [[to_name(csv_name,line,0,row[0])] + [to_float(csv_name,line,i,cell,blank=0) for i,cell in enumerate(row[1:],start=1)]
+               for line,row in stripped_rows(csv_name)]
+    n_days = max([len(i) for i in cleaned],default=0)
+    return [row + [0] * (n_days - len(row)) for row in cleaned]
 
 
 #%%
-# reads csv and returns list of lists
+# reads csv and returns list of lists, [start, end, capacity, cost]
 # takes cheapest path, if same cost, takes largest capacity
 # use for: shipping
 def read_shipping(csv_name:str):
-    data = clean_read(csv_name)
     dct = {}
-    for r in data:
-        newkey = r[0]+r[1]
-        if newkey not in list(dct.keys()):
-            dct[newkey] = r
-        elif dct[newkey][3] > r[3]:
-            dct[newkey] = r
-        elif dct[newkey][3] == r[3] and dct[newkey][2] < r[2]:
-            dct[newkey] = r
+    for line,row in stripped_rows(csv_name):
+        if len(row) != 4:
+            raise ValueError("{}:{}: expected start, end, capacity, cost".format(csv_name,line))
+        r = [to_name(csv_name,line,0,row[0]),to_name(csv_name,line,1,row[1]),
+             to_float(csv_name,line,2,row[2]),to_float(csv_name,line,3,row[3])]
+        key = (r[0],r[1])
+        if key not in dct:
+            dct[key] = r
+        elif dct[key][3] > r[3]:
+            dct[key] = r
+        elif dct[key][3] == r[3] and dct[key][2] < r[2]:
+            dct[key] = r
     return list(dct.values())
 
+# file_hash(fname):
+#   sha256 of the file's contents
+# Returns -> str
+def file_hash(fname:str):
+    digest = hashlib.sha256()
+    with open(fname,"rb") as f:
+        for block in iter(lambda: f.read(1 << 20),b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+# read_cached(reader,csv_name,cache_dir):
+#   reader(csv_name), stored in cache_dir as a pickle named after the reader
+#   and the file's hash; without cache_dir the file is just read
+def read_cached(reader,csv_name:str,cache_dir=None):
+    if cache_dir is None:
+        return reader(csv_name)
+    fname = os.path.join(cache_dir,"{}-{}-v{}.pickle".format(reader.__name__,file_hash(csv_name),CACHE_VERSION))
+    if os.path.exists(fname):
+        with open(fname,"rb") as f:
+            return pickle.load(f)
+    data = reader(csv_name)
+    os.makedirs(cache_dir,exist_ok=True)
+    # write then rename, so a concurrent run never reads a partial file
+    tmp = "{}.{}.tmp".format(fname,os.getpid())
+    with open(tmp,"wb") as f:
+        pickle.dump(data,f,protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp,fname)
+    return data
+
 # # %%
 # # EXAMPLES:
 # factories = read_cost_values("../data/factories.csv")
@@ -0,0 +1,160 @@
+#%%
+import csv
+import numpy as np
+import model_ir
+
+"""
+Columnar solution export
+
+Instead of one formatted line per variable (zeros included), the solution
+values are fetched in one getAttr call and only the nonzeros are written, one
+row per variable with its decoded index:
+
+    variable,type,material,origin,destination,place,day,value
+    z_metal1_a->b_3,z,metal1,a,b,,3,40
+
+type is the variable kind (x, y, z, s, M); origin/destination are set for
+shipments (z, s), place for manufacturing and stock (x, y, M). Files ending
+in .parquet are written with pyarrow (imported only then), anything else as
+csv, one variable family at a time.
+"""
+
+RESULT_FIELDS = ["variable","type","material","origin","destination","place","day","value"]
+CHUNK = 100000
+
+
+# solution_values(m):
+#   all variable values of a solved model, fetched in bulk
+# Returns -> float array, ir order
+def solution_values(m):
+    return np.array(m.getAttr("X",m.getVars()))
+
+# decode_family(ir,fam,pos,values):
+#   result columns of the given positions of one variable family
+# Returns -> dict with RESULT_FIELDS as keys and equal-length lists as values
+def decode_family(ir,fam,pos,values):
+    n = len(pos)
+    index = {f:fam["index"][f][pos] for f in fam["fields"]}
+    names = np.array(ir["materials"] + [""],dtype=object)
+    places = np.array(ir["places"] + [""],dtype=object)
+    blank = np.full(n,-1)
+
+    columns = {"variable":[fam["template"].format(*[model_ir.label(ir,f,i) for f,i in zip(fam["fields"],vals)])
+                           for vals in zip(*[index[f] for f in fam["fields"]])],
+               "type":[fam["template"].split("_")[0]] * n,
+               "material":names[index.get("material",blank)].tolist(),
+               "origin":places[ir["arc_start"][index["arc"]] if "arc" in index else blank].tolist(),
+               "destination":places[ir["arc_end"][index["arc"]] if "arc" in index else blank].tolist(),
+               "place":places[index.get("place",blank)].tolist(),
+               "day":index["day"].tolist(),
+               "value":values.tolist()}
+    return columns
+
+# nonzero_columns(ir,values,tol):
+#   result columns of every variable with |value| > tol, one family at a time
+# Returns -> generator of dicts (see decode_family)
+def nonzero_columns(ir,values,tol=1e-6):
+    for fam in ir["var_families"]:
+        block = values[fam["offset"]:fam["offset"] + fam["size"]]
+        pos = np.flatnonzero(np.abs(block) > tol)
+        for first in range(0,len(pos),CHUNK):
+            chunk = pos[first:first + CHUNK]
+            yield decode_family(ir,fam,chunk,np.round(block[chunk],6))
+
+# parse_name(name):
+#   result fields of a variable name of the dict-based model (the templates
+#   of format_data.gen_decision_variables, e.g. "z_metal1_a->b_3");
+#   material names are taken to hold no "_" (place names may), and a name
+#   that fits no template only fills variable
+# Returns -> dict with RESULT_FIELDS but value as keys
+def parse_name(name):
+    fields = {"variable":name,"type":"","material":"","origin":"","destination":"","place":"","day":""}
+    try:
+        typ, rest = name.split("_",1)
+        rest, day = rest.rsplit("_",1)
+        day = int(day)
+        if typ == "s":
+            origin, destination = rest.split("->",1)
+            fields.update(origin=origin,destination=destination)
+        elif typ == "z":
+            material, arc = rest.split("_",1)
+            origin, destination = arc.split("->",1)
+            fields.update(material=material,origin=origin,destination=destination)
+        elif typ in ("x","y","M"):
+            material, place = rest.split("_",1)
+            fields.update(material=material,place=place)
+        else:
+            return fields
+        fields.update(type=typ,day=day)
+    except ValueError:
+        pass
+    return fields
+
+# named_columns(m,values,tol):
+#   result columns of a model without an ir (run_model.solve), decoded
+#   from the variable names
+# Returns -> generator of dicts (see decode_family)
+def named_columns(m,values,tol=1e-6):
+    allvars = m.getVars()
+    pos = np.flatnonzero(np.abs(values) > tol)
+    for first in range(0,len(pos),CHUNK):
+        chunk = pos[first:first + CHUNK]
+        rows = [parse_name(name) for name in m.getAttr("VarName",[allvars[j] for j in chunk])]
+        columns = {k:[row[k] for row in rows] for k in RESULT_FIELDS if k != "value"}
+        columns["value"] = np.round(values[chunk],6).tolist()
+        yield columns
+
+# write_csv(chunks,fname):
+#   streams result columns to a csv file
+# Returns -> int, number of rows written
+def write_csv(chunks,fname):
+    n = 0
+    with open(fname,"w",newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(RESULT_FIELDS)
+        for columns in chunks:
+            writer.writerows(zip(*[columns[k] for k in RESULT_FIELDS]))
+            n += len(columns["value"])
+    return n
+
+# write_parquet(chunks,fname):
+#   streams result columns to a parquet file, one row group per chunk
+# Returns -> int, number of rows written
+def write_parquet(chunks,fname):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([(k,pa.float64() if k == "value" else pa.int64() if k == "day" else pa.string())
+                        for k in RESULT_FIELDS])
+    n = 0
+    with pq.ParquetWriter(fname,schema) as writer:
+        for columns in chunks:
+            columns = dict(columns,day=[d if d != "" else None for d in columns["day"]])
+            writer.write_table(pa.table(columns,schema=schema))
+            n += len(columns["value"])
+    return n
+
+# write_chunks(chunks,fname):
+#   writes result columns to fname, parquet for .parquet files, csv otherwise
+# Returns -> int, number of rows written
+def write_chunks(chunks,fname):
+    if fname.endswith(".parquet"):
+        return write_parquet(chunks,fname)
+    return write_csv(chunks,fname)
+
+# write_values(ir,values,fname,tol):
+#   writes the nonzero entries of a solution in ir order (e.g. from another
+#   backend, see backends.py) to fname
+# Returns -> int, number of rows written
+def write_values(ir,values,fname,tol=1e-6):
+    return write_chunks(nonzero_columns(ir,np.asarray(values,dtype=float),tol),fname)
+
+# write_results(m,fname,tol):
+#   writes the nonzero variables of a solved model to fname (.parquet or csv);
+#   models from run_model.build_ir_model (with m._ir) get decoded columns
+# Returns -> int, number of rows written
+def write_results(m,fname,tol=1e-6):
+    values = solution_values(m)
+    ir = getattr(m,"_ir",None)
+    chunks = nonzero_columns(ir,values,tol) if ir is not None else named_columns(m,values,tol)
+    return write_chunks(chunks,fname)
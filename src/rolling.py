@@ -0,0 +1,152 @@
+#%%
+import argparse
+import time
+import numpy as np
+import format_data
+import model_ir
+import profiling
+import read_data
+import run_model
+import updates
+
+"""
+Rolling-horizon re-planning on a live Gurobi model
+
+Instead of rebuilding and re-solving the whole horizon every day, replan keeps
+the model returned by run_model.solve_ir and
+- fixes every variable of the days already executed at its planned value
+- updates only the demand right-hand sides that changed in the new forecast,
+  from the day after next: the demand rows of the next day only hold
+  variables of executed days, so a changed forecast for that day is
+  reported as a shortfall of the executed plan instead
+- shifts the on-hand equalities by the observed stock discrepancy
+- re-optimizes starting from the previous solution (MIP start)
+
+    spec = format_data.build_model("../data")
+    m = format_data.solve(spec)
+    m = rolling.replan(m, 1, hospitals=read_data.read_demand("day2/hospitals.csv"))
+"""
+
+
+# fix_days(m,ir,last_day,values):
+#   fixes all variables of days 0..last_day at values (nothing for last_day 0)
+# Returns -> int, number of variables fixed
+def fix_days(m,ir,last_day,values):
+    if last_day <= 0:
+        return 0
+    fixed = np.flatnonzero(model_ir.var_days(ir) <= last_day)
+    mvars = updates.handles(m._x,fixed)
+    m.setAttr("LB",mvars,values[fixed].tolist())
+    m.setAttr("UB",mvars,values[fixed].tolist())
+    return len(fixed)
+
+# update_demand(m,ir,hospitals,first_day):
+#   sets the demand rows from first_day on to a new forecast, touching only
+#   the rows whose right-hand side changed
+# Returns -> int, number of rows updated
+def update_demand(m,ir,hospitals,first_day):
+    rows = model_ir.family_slice(ir["constr_families"],"demand")
+    new_rhs = model_ir.demand_bounds(ir,hospitals)
+    days = model_ir.family(ir["constr_families"],"demand")["index"]["day"]
+    changed = np.flatnonzero((new_rhs != ir["rhs"][rows]) & (days >= first_day))
+    m.setAttr("RHS",updates.handles(m._rows,rows.start + changed),new_rhs[changed].tolist())
+    ir["rhs"][rows.start + changed] = new_rhs[changed]
+    return len(changed)
+
+# committed_shortfall(m,ir,hospitals,day):
+#   the demand rows of day only hold variables of executed days, so the plan
+#   for day is already carried out; the units a new forecast asks for on day
+#   beyond the stock the solved plan has there (demand rows are
+#   -stock <= -demand, so the stock is slack - rhs)
+# Returns -> dict of (type, hospital) -> units short, only where short
+def committed_shortfall(m,ir,hospitals,day):
+    rows = model_ir.family_slice(ir["constr_families"],"demand")
+    index = model_ir.family(ir["constr_families"],"demand")["index"]
+    new_rhs = model_ir.demand_bounds(ir,hospitals)
+    on_day = np.flatnonzero(index["day"] == day)
+    ids = rows.start + on_day
+    stock = np.array(m.getAttr("Slack",updates.handles(m._rows,ids))) - ir["rhs"][ids]
+    short = -new_rhs[on_day] - stock
+    return {(model_ir.label(ir,"type",index["type"][i]),model_ir.label(ir,"place",index["place"][i])):float(v)
+            for i,v in zip(on_day,short) if v > 1e-6}
+
+# update_stock(m,ir,stock,last_day,values):
+#   observed stock at the end of last_day, as {(material, place): amount};
+#   the onhand row of the next day is shifted by (observed - planned) so the
+#   plan continues from the observed stock
+# Returns -> int, number of rows updated
+def update_stock(m,ir,stock,last_day,values):
+    if not stock:
+        return 0
+    if not 1 <= last_day < ir["n_days"] - 1:
+        raise ValueError("stock can only be updated between two planned days")
+    mat_id = {k:i for i,k in enumerate(ir["materials"])}
+    place_id = {p:i for i,p in enumerate(ir["places"])}
+    rows, shifts = [], []
+    for (material,place),amount in stock.items():
+        if place == model_ir.DUMMY:
+            raise ValueError("{} stock is not carried from day to day".format(model_ir.DUMMY))
+        mat, p = mat_id[material], place_id[place]
+        var, row = int(model_ir.M_id(ir,mat,p,last_day)), int(model_ir.onhand_id(ir,mat,p,last_day + 1))
+        if row < 0:
+            raise ValueError("{} can never be at {} (dropped by the presolve)".format(material,place))
+        # a stock variable dropped by the presolve is always 0
+        planned = values[var] if var >= 0 else 0
+        rows.append(row)
+        shifts.append(amount - planned)
+    rows, shifts = np.array(rows,dtype=np.int64), np.array(shifts)
+    ir["rhs"][rows] += shifts
+    m.setAttr("RHS",updates.handles(m._rows,rows),ir["rhs"][rows].tolist())
+    return len(rows)
+
+# replan(m,executed_day,hospitals,stock):
+#   re-plans a model from run_model.solve_ir after days 1..executed_day have
+#   been carried out; hospitals is a new forecast (read_demand format) and
+#   stock the observed stock at the end of executed_day (see update_stock);
+#   forecast changes for day executed_day + 1 are printed as shortfalls (see
+#   committed_shortfall) and applied from executed_day + 2 on; the re-plan
+#   time is printed and kept on the model as m._replan_time
+# Returns -> the same gurobipy model, re-optimized
+def replan(m,executed_day,hospitals=None,stock=None):
+    start = time.perf_counter()
+    ir = m._ir
+    if m.SolCount == 0:
+        raise ValueError("the model has no solution to re-plan from")
+    values = np.concatenate([x.X for x in m._x])
+
+    n_fixed = fix_days(m,ir,executed_day,values)
+    n_demand = 0
+    if hospitals is not None:
+        if executed_day + 1 < ir["n_days"]:
+            for (typ,hospital),units in committed_shortfall(m,ir,hospitals,executed_day + 1).items():
+                print('Day {} is committed: {} {} short of the new forecast by {:,.0f} units'.format(
+                    executed_day + 1,hospital,typ,units))
+        n_demand = update_demand(m,ir,hospitals,executed_day + 2)
+    n_stock = update_stock(m,ir,stock,executed_day,values)
+    print('Re-plan after day {}: {} variables fixed, {} demand rows and {} onhand rows updated'.format(
+        executed_day,n_fixed,n_demand,n_stock))
+
+    # warm start from the previous plan
+    ends = np.cumsum([x.shape[0] for x in m._x])
+    for x,v in zip(m._x,np.split(values,ends[:-1])):
+        x.Start = v
+    profiling.optimize(m)
+    m._replan_time = time.perf_counter() - start
+    print('Re-plan time: {:.2f}s'.format(m._replan_time))
+
+    run_model.print_solution(m)
+    return m
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve the model, then re-plan once per new hospitals forecast")
+    parser.add_argument("--data",default=format_data.DATA_DIR,help="directory holding the input csvs")
+    parser.add_argument("forecasts",nargs="*",help="hospitals.csv of day 2, day 3, ...")
+    args = parser.parse_args(argv)
+
+    m = format_data.solve(format_data.build_model(args.data))
+    for executed_day,fname in enumerate(args.forecasts,start=1):
+        m = replan(m,executed_day,hospitals=read_data.read_demand(fname))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
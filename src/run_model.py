@@ -4,24 +4,68 @@
 CO 327 Final Project
 
 This is our Final model using Python + Gurobi to model and solve the medical supply optimization problem
+
+gurobipy (and scipy) are imported inside the solve functions, so importing
+this module does not check out a licence
 """
 #%%
-import gurobipy as gp 
-from gurobipy import GRB
+import os
+import time
+import numpy as np
+import model_ir
+import profiling
+import results
+
+OUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)),"..","out")
 
-def print_solution(model):
+# print_solution(model, out_dir, write_lp):
+#   writes the nonzero variables to results.csv (see results.py) and prints
+#   the objective; the LP file is only written (and the model named) with
+#   write_lp, as both are slow on large models
+def print_solution(model, out_dir=OUT_DIR, write_lp=False):
     print()
     print('###### Results ######')
     
-    model.write('../out/linear_program.lp')
-    try:
-        with open("../out/results.txt","w+") as f:
-            for v in model.getVars():
-                f.write('{}: {:,.0f}\n'.format(v.varName, v.x))
-            print('Obj: {:,.0f}'.format(model.objVal))
-            f.write('Obj: {:,.0f}\n'.format(model.objVal))
-    except:
+    os.makedirs(out_dir, exist_ok=True)
+    if write_lp:
+        if hasattr(model, "_ir"):
+            name_model(model, model._ir)
+        model.write(os.path.join(out_dir,'linear_program.lp'))
+    if model.SolCount == 0:
+        print("No Solution Found")
+        return
+    with profiling.span("write_results"):
+        n = results.write_results(model, os.path.join(out_dir,"results.csv"))
+    print('Obj: {:,.0f} ({:,} nonzero variables written)'.format(model.objVal, n))
+
+# print_values(ir, values, objective, out_dir):
+#   same as print_solution for a solution from another backend (see
+#   backends.py), given as variable values in ir order
+def print_values(ir, values, objective, out_dir=OUT_DIR):
+    print()
+    print('###### Results ######')
+
+    os.makedirs(out_dir, exist_ok=True)
+    if values is None:
         print("No Solution Found")
+        return
+    with profiling.span("write_results"):
+        n = results.write_values(ir, values, os.path.join(out_dir,"results.csv"))
+    print('Obj: {:,.0f} ({:,} nonzero variables written)'.format(objective, n))
+
+# group_recipes(recipes, decision_vars, constraint_names):
+#   buckets recipes by constraint name in a single pass, so constraint
+#   construction scales with the number of nonzeros instead of
+#   (variables x constraints); recipes that refer to unknown variables
+#   or constraints are dropped, as the original quicksum scan did
+# Returns -> dict with constraint name as "key" and list of (coefficient, variable) as "val"
+def group_recipes(recipes, decision_vars, constraint_names):
+    known_vars = set(decision_vars)
+    rows = {k: [] for k in constraint_names}
+    for (i,k),coeff in recipes.items():
+        if k in rows and i in known_vars:
+            rows[k].append((coeff,i))
+    return rows
 
 # defines a function solve which solves a binary marketing problem
 # objective: a dictionary with where keys are decision variables
@@ -32,6 +76,10 @@ def print_solution(model):
 # upper_bounds: values which each contraint is less than or equal to 
 # lower_bounds: values which each contraint is greater than or equal to 
 def solve(objective, decision_vars, recipes, upper_bounds, equalities):
+    import gurobipy as gp
+    from gurobipy import GRB
+
+    build_start = time.perf_counter()
     m = gp.Model("corona-opt")
 
     # create decision variables for marketing methods
@@ -41,16 +89,129 @@ def solve(objective, decision_vars, recipes, upper_bounds, equalities):
     # set objective to maximize reach
     m.setObjective(outcome.prod(objective), GRB.MINIMIZE)
 
+    rows = profiling.call(group_recipes, recipes, decision_vars, list(upper_bounds.keys()) + list(equalities.keys()))
+
     # upper bounds
-    m.addConstrs((gp.quicksum(recipes[(i,k)]*allvars[i] for i in decision_vars if (i,k) in recipes.keys()) <= upper_bounds[k] for  k in upper_bounds.keys()), "upper")
+    with profiling.span("add_upper_bounds", entries=len(upper_bounds)):
+        for k,rhs in upper_bounds.items():
+            coeffs = [c for c,i in rows[k]]
+            row_vars = [allvars[i] for c,i in rows[k]]
+            m.addLConstr(gp.LinExpr(coeffs,row_vars), GRB.LESS_EQUAL, rhs, "upper[{}]".format(k))
 
     # lower bounds
-    m.addConstrs((gp.quicksum(recipes[(i,k)]*allvars[i] for i in decision_vars if (i,k) in recipes.keys()) == equalities[k] for  k in equalities.keys()), "eq")
+    with profiling.span("add_equalities", entries=len(equalities)):
+        for k,rhs in equalities.items():
+            coeffs = [c for c,i in rows[k]]
+            row_vars = [allvars[i] for c,i in rows[k]]
+            m.addLConstr(gp.LinExpr(coeffs,row_vars), GRB.EQUAL, rhs, "eq[{}]".format(k))
 
     # solve model
-    m.optimize()
+    optimize_timed(m, build_start)
 
     # print solution
     print_solution(m)
 
     return m
+
+# optimize_timed(m, build_start):
+#   finishes the build, then optimizes; build and solve wall times are
+#   printed and kept on the model as m._build_time and m._solve_time
+def optimize_timed(m, build_start):
+    m.update()
+    m._build_time = time.perf_counter() - build_start
+    print('Build time: {:.2f}s'.format(m._build_time))
+
+    solve_start = time.perf_counter()
+    profiling.optimize(m)
+    m._solve_time = time.perf_counter() - solve_start
+    print('Solve time: {:.2f}s'.format(m._solve_time))
+
+# name_model(m, ir):
+#   attaches the human-readable names to a model built by solve_ir;
+#   only done right before the LP file is written
+def name_model(m, ir):
+    m.setAttr("VarName", m.getVars(), model_ir.var_names(ir))
+    m.setAttr("ConstrName", m.getConstrs(), ["{}[{}]".format("upper" if sense == "<" else "eq", name)
+        for sense,name in zip(ir["sense"], model_ir.constr_names(ir))])
+
+# build_matrix_model(obj, A, sense, rhs, vtype, lb, ub, params, chunk_rows):
+#   builds (without solving) a minimization model obj @ x s.t. A @ x (sense) rhs
+#   through the matrix API; vtype, lb and ub are per-variable arrays or
+#   scalars and params are Gurobi parameters set before the build; with
+#   chunk_rows, A is added that many rows at a time (e.g. a memory-mapped A).
+#   The MVar and MConstr blocks are kept on the model as m._x and m._rows
+#   (lists, in column / row order; gurobipy uses m._constrs itself) so
+#   variables and rows can be addressed by id (see updates.handles)
+# Returns -> gurobipy model
+def build_matrix_model(obj, A, sense, rhs, vtype, lb=0.0, ub=float("inf"), params=None, chunk_rows=None):
+    import gurobipy as gp
+    from gurobipy import GRB
+
+    m = gp.Model("corona-opt")
+    for name,value in (params or {}).items():
+        m.setParam(name, value)
+
+    x = m.addMVar(len(obj), lb=lb, ub=ub, vtype=vtype)
+    m.setObjective(obj @ x, GRB.MINIMIZE)
+    if chunk_rows is None:
+        m._rows = [m.addMConstr(A, x, sense, rhs)]
+    else:
+        m._rows = []
+        for first in range(0, A.shape[0], chunk_rows):
+            rows = slice(first, first + chunk_rows)
+            m._rows.append(m.addMConstr(A[rows], x, sense[rows], rhs[rows]))
+    m._x = [x]
+    m.update()
+    return m
+
+# ir_matrix(ir):
+#   constraint matrix of a model_ir.build_ir representation; for a streamed
+#   build (ir["matrix"], see streaming.py) the files are memory-mapped, and
+#   the coefficient blocks of arcs added later (ir["added_coefficients"],
+#   see updates.add_arc) are included
+# Returns -> scipy.sparse csr matrix
+def ir_matrix(ir):
+    import scipy.sparse as sp
+    if "matrix" in ir:
+        import streaming
+        return streaming.load_matrix(ir["matrix"])
+    rows, cols, vals = ir["rows"], ir["cols"], ir["vals"]
+    if ir.get("added_coefficients"):
+        added = ir["added_coefficients"]
+        rows, cols, vals = [np.concatenate([whole] + [block[k] for block in added]) for k, whole in enumerate((rows, cols, vals))]
+    return sp.csr_matrix((vals, (rows, cols)), shape=(ir["n_constrs"], ir["n_vars"]))
+
+# build_ir_model(ir, rhs, params, vtype):
+#   builds (without solving) the model of a model_ir.build_ir representation
+#   (one sparse matrix, one addMConstr call); rhs optionally replaces ir["rhs"],
+#   vtype defaults to all integer; variables and constraints are left unnamed
+#   and the ir is kept on the model as m._ir; a streamed matrix is added in
+#   chunks of streaming.CHUNK_ROWS rows
+# Returns -> gurobipy model
+def build_ir_model(ir, rhs=None, params=None, vtype=None):
+    from gurobipy import GRB
+
+    with profiling.span("build_ir_model"):
+        chunk_rows = None
+        if "matrix" in ir:
+            import streaming
+            chunk_rows = streaming.CHUNK_ROWS
+        m = build_matrix_model(ir["obj"], ir_matrix(ir), ir["sense"], ir["rhs"] if rhs is None else rhs,
+                               GRB.INTEGER if vtype is None else vtype, params=params, chunk_rows=chunk_rows)
+    m._ir = ir
+    return m
+
+# solve_ir(ir, write_lp, start):
+#   same model as solve, built with build_ir_model; names are only attached
+#   when the LP file is written; start optionally gives a warm start (variable
+#   values in ir order, e.g. from solution_cache.py)
+def solve_ir(ir, write_lp=False, start=None):
+    build_start = time.perf_counter()
+    m = build_ir_model(ir)
+    if start is not None:
+        m.setAttr("Start", m.getVars(), start)
+    optimize_timed(m, build_start)
+
+    print_solution(m, write_lp=write_lp)
+
+    return m
@@ -0,0 +1,143 @@
+#%%
+import argparse
+import concurrent.futures
+import csv
+import json
+import time
+import numpy as np
+import backends
+import format_data
+import model_ir
+
+"""
+What-if scenario sweeps over one base model
+
+The base model is built once from the csvs; each scenario only changes
+right-hand sides (demand bounds, shipping capacities, starting stock), so the
+structure (ir rows/cols/vals) is shared by every scenario. Scenarios are
+solved in a process pool, each solver limited to a thread budget; with an
+open-source backend (backends.py) the pool is not capped by licences.
+
+A scenario is a dict (a list of them is read from a json file):
+    {"name": "toronto down, demand +20%",
+     "demand_scale": 1.2,                      # or {"toronto_general": 1.5, ...}
+     "offline_factories": ["toronto_factory"], # no starting stock, all arcs closed
+     "arc_capacity": {"quebec_factory->qikiqtami_general": 0.5}}  # capacity factors
+"""
+
+SUMMARY_FIELDS = ["scenario","status","objective","unmet_demand","solve_time"]
+
+
+# scenario_rhs(ir,scenario):
+#   right-hand sides of the base model with the scenario deltas applied
+# Returns -> float array of length n_constrs
+def scenario_rhs(ir,scenario):
+    rhs = ir["rhs"].copy()
+    places = ir["places"]
+    place_id = {p:i for i,p in enumerate(places)}
+    arc_id = {model_ir.label(ir,"arc",a):a for a in range(len(ir["arc_start"]))}
+    demand = model_ir.family(ir["constr_families"],"demand")
+    onhand = model_ir.family(ir["constr_families"],"onhand")
+
+    # scaled hospital demand
+    scale = scenario.get("demand_scale",1)
+    if isinstance(scale,dict):
+        unknown = set(scale) - set(places[ir["n_factories"]:])
+        if unknown:
+            raise ValueError("unknown hospitals in demand_scale: {}".format(sorted(unknown)))
+        scale = np.array([scale.get(p,1) for p in places],dtype=float)[demand["index"]["place"]]
+    rhs[model_ir.family_slice(ir["constr_families"],"demand")] *= scale
+
+    # capacity factors per arc
+    factors = np.ones(len(ir["arc_start"]))
+    for arc,factor in scenario.get("arc_capacity",{}).items():
+        if arc not in arc_id:
+            raise ValueError("unknown arc in arc_capacity: {}".format(arc))
+        factors[arc_id[arc]] *= factor
+
+    # offline factories: no starting stock and every arc touching them closed
+    for factory in scenario.get("offline_factories",[]):
+        p = place_id.get(factory,-1)
+        if p not in ir["made"]:
+            raise ValueError("unknown factory in offline_factories: {}".format(factory))
+        factors[(ir["arc_start"] == p) | (ir["arc_end"] == p)] = 0
+        first_day = (onhand["index"]["place"] == p) & (onhand["index"]["day"] == 1)
+        rhs[onhand["offset"] + np.flatnonzero(first_day)] = 0
+
+    # arcs added to the model (updates.add_arc) have capacities families of their own
+    for fam in ir["constr_families"]:
+        if fam["name"] in ("capacities","capacities_added"):
+            rhs[fam["offset"]:fam["offset"] + fam["size"]] *= factors[fam["index"]["arc"]]
+    return rhs
+
+
+### Worker processes
+###     The base ir is sent once per worker (initializer), not once per scenario
+
+worker_state = {}
+
+def init_worker(ir,threads,backend):
+    worker_state["ir"] = ir
+    worker_state["threads"] = threads
+    worker_state["backend"] = backend
+    worker_state["unmet"] = model_ir.dummy_supply_vars(ir)
+
+# run_scenario(scenario):
+#   solves one scenario in the current worker
+# Returns -> dict with SUMMARY_FIELDS as keys
+def run_scenario(scenario):
+    ir = worker_state["ir"]
+    start = time.perf_counter()
+    solution = backends.solve_ir(ir,worker_state["backend"],{"threads":worker_state["threads"]},
+                                 scenario_rhs(ir,scenario))
+    row = {"scenario":scenario.get("name",""),
+           "status":solution.status,
+           "objective":solution.objective,
+           "unmet_demand":None,
+           "solve_time":time.perf_counter() - start}
+    if solution.values is not None:
+        row["unmet_demand"] = solution.values[worker_state["unmet"]].sum()
+    return row
+
+# run_scenarios(ir,scenarios,workers,threads,backend):
+#   solves all scenarios on a pool of workers processes, threads solver
+#   threads each, with one of backends.BACKENDS (open-source backends need
+#   no licence per worker)
+# Returns -> list of dicts with SUMMARY_FIELDS as keys, in scenario order
+def run_scenarios(ir,scenarios,workers=None,threads=1,backend="gurobi"):
+    # fail on bad scenarios before starting any solve
+    for scenario in scenarios:
+        scenario_rhs(ir,scenario)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers,initializer=init_worker,
+                                                initargs=(ir,threads,backend)) as pool:
+        return list(pool.map(run_scenario,scenarios))
+
+# write_summary(rows,fname):
+#   writes the scenario summary table as csv
+def write_summary(rows,fname):
+    with open(fname,"w",newline="") as f:
+        writer = csv.DictWriter(f,fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Solve what-if scenarios of the model in parallel")
+    parser.add_argument("scenarios",help="json file with a list of scenarios")
+    parser.add_argument("--data",default=format_data.DATA_DIR,help="directory holding the input csvs")
+    parser.add_argument("--workers",type=int,default=None,help="solver processes (default: one per core)")
+    parser.add_argument("--threads",type=int,default=1,help="solver threads per solver process")
+    parser.add_argument("--backend",default="gurobi",choices=backends.BACKENDS,help="solver (see backends)")
+    parser.add_argument("--out",default="scenarios.csv",help="summary csv")
+    args = parser.parse_args(argv)
+
+    with open(args.scenarios) as f:
+        scenarios = json.load(f)
+    spec = format_data.build_model(args.data)
+    rows = run_scenarios(spec.ir,scenarios,args.workers,args.threads,args.backend)
+    write_summary(rows,args.out)
+    for row in rows:
+        print("{scenario}: {status}, objective {objective}, unmet demand {unmet_demand}".format(**row))
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,240 @@
+#%%
+import hashlib
+import json
+import os
+import pickle
+import numpy as np
+import backends
+import format_data
+import results
+import run_model
+
+"""
+Persistent cache of solved models
+
+Re-running identical or near-identical inputs should not mean re-solving the
+integer program. Each solve is stored under two keys:
+- input key:     sha256 of the parsed inputs (format_data.read_inputs, in file
+                 order) and the solve settings (backend, mode, block days,
+                 presolve on / off)
+- structure key: sha256 of the variable layout of the model (materials,
+                 places, arcs, recipe pairs, days and the variables the presolve
+                 kept) and the same settings
+An exact hit on the input key returns the stored solution without solving,
+if it was solved to optimality. Otherwise the entry under the input key (a
+plan cut short by a time limit), or else the most recently used entry with
+the same structure (a near hit: e.g. only demands, stock or capacities
+changed) warm-starts the solve in "mip" mode on a backend that takes a start
+(backends.WARM_STARTS); other near hits are solved from scratch and counted
+as near hits not used. Anything else is a miss.
+
+Entries are pickles in cache_dir/solutions; index.json holds the LRU order,
+the entry sizes and the hit / miss counters. Once the entries exceed
+max_bytes, the least recently used ones are evicted.
+
+    cache = solution_cache.open_cache()
+    result = solution_cache.solve(cache, format_data.build_model("../data"))
+    print(solution_cache.report(cache))
+"""
+
+CACHE_VERSION = 1
+MAX_BYTES = 256 * 2**20
+STATS = ["hits","near_hits","near_unused","misses","evictions"]
+
+
+### Keys
+
+def digest(parts):
+    h = hashlib.sha256()
+    for part in parts:
+        h.update(part if isinstance(part,bytes) else part.encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+# solve_settings(ir,mode,block_days,backend):
+#   the settings that, next to the inputs, decide the solution
+# Returns -> dict
+def solve_settings(ir,mode,block_days,backend):
+    return {"backend":backend,"mode":mode,"block_days":block_days if mode == "blocks" else None,
+            "prune":"presolve" in ir,"version":CACHE_VERSION}
+
+# input_key(data,settings):
+#   exact key of a solve: parsed inputs and settings
+# Returns -> str
+def input_key(data,settings):
+    return digest([json.dumps(data),json.dumps(settings,sort_keys=True)])
+
+# structure_key(ir,settings):
+#   key of the variable layout: two models with the same structure key have
+#   the same variables in the same order, so one's solution can start the other
+# Returns -> str
+def structure_key(ir,settings):
+    arrays = [ir["arc_start"],ir["arc_end"],ir["x_pairs"],ir["y_pairs"]]
+    arrays += [fam.get("map",np.array([fam["size"]])) for fam in ir["var_families"]]
+    return digest([json.dumps([ir["materials"],ir["places"],ir["n_days"],
+                               [fam["name"] for fam in ir["var_families"]]]),
+                   json.dumps(settings,sort_keys=True)]
+                  + [np.ascontiguousarray(a,dtype=np.int64).tobytes() for a in arrays])
+
+
+### Storage
+
+# open_cache(cache_dir,max_bytes):
+#   loads (or starts) the cache index in cache_dir/solutions
+# Returns -> dict with dir, max_bytes, index and the counters of this run
+def open_cache(cache_dir=format_data.CACHE_DIR,max_bytes=MAX_BYTES):
+    path = os.path.join(cache_dir,"solutions")
+    index = {"clock":0,"entries":{},"stats":dict.fromkeys(STATS,0)}
+    if os.path.exists(os.path.join(path,"index.json")):
+        with open(os.path.join(path,"index.json")) as f:
+            index = json.load(f)
+        # indexes written before a counter existed
+        for stat in STATS:
+            index["stats"].setdefault(stat,0)
+    return {"dir":path,"max_bytes":max_bytes,"index":index,"run":dict.fromkeys(STATS,0)}
+
+def entry_file(cache,key):
+    return os.path.join(cache["dir"],key + ".pickle")
+
+# write_atomic(fname,write):
+#   write(f) into a temporary file renamed to fname, so a concurrent run
+#   never reads a partial file
+def write_atomic(fname,write,mode="w"):
+    tmp = "{}.{}.tmp".format(fname,os.getpid())
+    with open(tmp,mode) as f:
+        write(f)
+    os.replace(tmp,fname)
+
+def save_index(cache):
+    os.makedirs(cache["dir"],exist_ok=True)
+    write_atomic(os.path.join(cache["dir"],"index.json"),lambda f: json.dump(cache["index"],f))
+
+def count(cache,stat,n=1):
+    cache["index"]["stats"][stat] += n
+    cache["run"][stat] += n
+
+# touch(cache,key):
+#   marks an entry as most recently used
+def touch(cache,key):
+    cache["index"]["clock"] += 1
+    cache["index"]["entries"][key]["used"] = cache["index"]["clock"]
+
+# load(cache,key):
+#   a stored entry, None if its file is gone (the index entry is dropped)
+# Returns -> dict of values, objective, bound, status, backend
+def load(cache,key):
+    try:
+        with open(entry_file(cache,key),"rb") as f:
+            return pickle.load(f)
+    except FileNotFoundError:
+        del cache["index"]["entries"][key]
+        return None
+
+# lookup(cache,key,structure):
+#   the entry stored under key, or else the most recently used one with the
+#   same structure; an entry under key that was not solved to optimality
+#   (time limit, interrupted) is only a near hit
+# Returns -> ("hit" | "near" | "miss", entry dict or None)
+def lookup(cache,key,structure):
+    entries = cache["index"]["entries"]
+    if key in entries:
+        entry = load(cache,key)
+        if entry is not None:
+            touch(cache,key)
+            return "hit" if entry["status"] == "optimal" else "near", entry
+    near = sorted((e["used"],k) for k,e in entries.items() if e["structure"] == structure)
+    for used,k in reversed(near):
+        entry = load(cache,k)
+        if entry is not None:
+            touch(cache,k)
+            return "near", entry
+    return "miss", None
+
+# evict(cache):
+#   removes least recently used entries until the total size fits max_bytes
+def evict(cache):
+    entries = cache["index"]["entries"]
+    total = sum(e["bytes"] for e in entries.values())
+    for used,key in sorted((e["used"],k) for k,e in entries.items()):
+        if total <= cache["max_bytes"]:
+            break
+        total -= entries.pop(key)["bytes"]
+        if os.path.exists(entry_file(cache,key)):
+            os.remove(entry_file(cache,key))
+        count(cache,"evictions")
+
+# store(cache,key,structure,entry):
+#   adds a solved entry (evict runs before the index is saved)
+def store(cache,key,structure,entry):
+    os.makedirs(cache["dir"],exist_ok=True)
+    write_atomic(entry_file(cache,key),lambda f: pickle.dump(entry,f,protocol=pickle.HIGHEST_PROTOCOL),"wb")
+    cache["index"]["entries"][key] = {"structure":structure,"bytes":os.path.getsize(entry_file(cache,key)),
+                                      "objective":entry["objective"],"used":0}
+    touch(cache,key)
+
+
+### Solve
+
+# solved_entry(result,backend):
+#   the cache entry of format_data.solve's result (gurobipy model or
+#   backends.Solution)
+# Returns -> dict, None without a solution
+def solved_entry(result,backend):
+    if isinstance(result,backends.Solution):
+        if result.values is None:
+            return None
+        return {"values":np.asarray(result.values,dtype=float),"objective":result.objective,
+                "bound":result.bound,"status":result.status,"backend":backend}
+    if result.SolCount == 0:
+        return None
+    return {"values":results.solution_values(result),"objective":result.ObjVal,"bound":result.ObjBound,
+            "status":backends.gurobi_status(result),"backend":backend}
+
+# solve(cache,spec,mode,block_days,write_lp,backend):
+#   format_data.solve through the cache: an exact hit (an optimal stored
+#   solution) is written instead of solving, a near hit warm-starts the
+#   solve, and new solutions are stored; entries past max_bytes are evicted
+#   and the index saved either way
+# Returns -> backends.Solution for an exact hit, else as format_data.solve
+def solve(cache,spec,mode="mip",block_days=7,write_lp=False,backend="gurobi"):
+    settings = solve_settings(spec.ir,mode,block_days,backend)
+    key, structure = input_key(spec.data,settings), structure_key(spec.ir,settings)
+    try:
+        kind, entry = lookup(cache,key,structure)
+        if kind == "hit" and not write_lp:
+            count(cache,"hits")
+            print("Solution cache: exact hit {}, not solving".format(key[:12]))
+            run_model.print_values(spec.ir,entry["values"],entry["objective"])
+            return backends.Solution(entry["backend"],entry["status"],entry["objective"],entry["bound"],
+                                     entry["values"],0.0,0.0)
+
+        start = None
+        if kind != "miss" and mode == "mip" and backend in backends.WARM_STARTS:
+            count(cache,"near_hits")
+            print("Solution cache: near hit, warm start from a {} solution of objective {:,.2f}".format(
+                entry["status"],entry["objective"]))
+            start = entry["values"]
+        elif kind != "miss":
+            count(cache,"near_unused")
+            print("Solution cache: near hit not used, {} takes no start{}".format(
+                backend,"" if mode == "mip" else " in {} mode".format(mode)))
+        else:
+            count(cache,"misses")
+        result = format_data.solve(spec,mode,block_days,write_lp,backend,start)
+        entry = solved_entry(result,backend)
+        if entry is not None:
+            store(cache,key,structure,entry)
+        return result
+    finally:
+        evict(cache)
+        save_index(cache)
+
+# report(cache):
+#   hit / miss counts of this run and overall, and the cache size
+# Returns -> str
+def report(cache):
+    entries = cache["index"]["entries"].values()
+    return ("Solution cache: {hits} hits, {near_hits} near hits, {near_unused} near hits not used, {misses} misses this run; ".format(**cache["run"])
+            + "{hits} hits, {near_hits} near hits, {near_unused} near hits not used, {misses} misses, {evictions} evictions overall; ".format(**cache["index"]["stats"])
+            + "{} entries, {:.1f} of {:.1f} MB".format(len(entries),sum(e["bytes"] for e in entries) / 2**20,
+                                                     cache["max_bytes"] / 2**20))
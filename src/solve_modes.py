@@ -0,0 +1,146 @@
+#%%
+import time
+import numpy as np
+import model_ir
+import profiling
+import run_model
+
+"""
+Cheaper solve modes for large instances
+
+run_model.solve_ir declares every variable integer, including the flows z,
+stock M and totals s. The modes below trade accuracy for runtime:
+- "mip":    the full integer model (reference)
+- "lp":     LP relaxation, then rounding repair: the manufacturing counts
+            x/y are rounded down and fixed, and the flows, stock and totals
+            re-solved as integers around them (the full model only if that
+            fails)
+- "xy":     only the manufacturing counts x/y are integer
+- "blocks": time decomposition; day blocks of block_days are solved in order,
+            each with the earlier days fixed, so stock is carried forward; the
+            last day of a block stays free in the next one, as its shipments
+            only arrive (and count towards demand) the day after
+
+Every mode reports its objective against a lower bound of the full model
+(the LP relaxation, or the MIP bound in "mip" mode) as gap =
+(objective - bound) / |objective|, the same definition as Gurobi's MIPGap.
+"""
+
+MODES = ["mip","lp","xy","blocks"]
+
+
+# integer_mask(ir,names):
+#   True for the variables of the given families
+# Returns -> bool array of length n_vars
+def integer_mask(ir,names):
+    mask = np.zeros(ir["n_vars"],dtype=bool)
+    for name in names:
+        mask[model_ir.family_slice(ir["var_families"],name)] = True
+    return mask
+
+# vtypes(mask):
+#   Gurobi variable types, integer where mask is set
+def vtypes(mask):
+    from gurobipy import GRB
+    return np.where(mask,GRB.INTEGER,GRB.CONTINUOUS)
+
+# lp_bound(ir,params):
+#   LP relaxation objective, a lower bound on the full model
+# Returns -> (float, gurobipy model)
+def lp_bound(ir,params):
+    m = run_model.build_ir_model(ir,params=params,vtype=vtypes(np.zeros(ir["n_vars"],dtype=bool)))
+    profiling.optimize(m)
+    return m.ObjVal, m
+
+def solve_lp_repair(ir,params):
+    bound, lp = lp_bound(ir,params)
+    values = np.array(lp.getAttr("X",lp.getVars()))
+    lp.dispose()
+
+    # rounding the manufacturing counts down keeps their resource use within
+    # stock; fixing any flow would pin the stock equalities that link it to
+    # the other days, so the flows are re-solved around the fixed counts
+    xy = integer_mask(ir,["x","y"])
+    made = np.floor(values[xy] + 1e-6)
+    print('Rounding repair: {} of {} manufacturing counts fractional, rounded down'.format(
+        int((values[xy] - made > 1e-6).sum()),int(xy.sum())))
+    m = run_model.build_ir_model(ir,params=params)
+    allvars = m.getVars()
+    fixed = [allvars[j] for j in np.flatnonzero(xy)]
+    m.setAttr("LB",fixed,made.tolist())
+    m.setAttr("UB",fixed,made.tolist())
+    profiling.optimize(m)
+
+    if m.SolCount == 0:
+        # last resort: the full model warm-started from the rounded counts
+        print('Rounding repair infeasible, solving the full model from the rounded start')
+        m.setAttr("LB",fixed,[0.0] * len(fixed))
+        m.setAttr("UB",fixed,[float("inf")] * len(fixed))
+        m.setAttr("Start",fixed,made.tolist())
+        profiling.optimize(m)
+    return m, bound
+
+def solve_xy(ir,params):
+    m = run_model.build_ir_model(ir,params=params,vtype=vtypes(integer_mask(ir,["x","y"])))
+    profiling.optimize(m)
+    # the x/y-integer model is a relaxation of the full model, so its bound is too
+    return m, m.ObjBound
+
+def solve_blocks(ir,params,block_days):
+    bound, lp = lp_bound(ir,params)
+    lp.dispose()
+
+    A = run_model.ir_matrix(ir)
+    var_days, constr_days = model_ir.var_days(ir), model_ir.constr_days(ir)
+    lb, ub = np.zeros(ir["n_vars"]), np.full(ir["n_vars"],np.inf)
+    last = ir["n_days"] - 1
+    for first in range(1,last + 1,block_days):
+        upto = min(first + block_days - 1,last)
+        # rows of days <= upto only refer to variables of days <= upto
+        cols = np.flatnonzero(var_days <= upto)
+        rows = np.flatnonzero(constr_days <= upto)
+        m = run_model.build_matrix_model(ir["obj"][cols],A[rows][:,cols],ir["sense"][rows],ir["rhs"][rows],
+                                         vtypes(np.ones(len(cols),dtype=bool)),lb[cols],ub[cols],params)
+        profiling.optimize(m)
+        if m.SolCount == 0:
+            raise RuntimeError("day block {}-{} has no solution".format(first,upto))
+        print('Day block {}-{}: objective {:,.0f}'.format(first,upto,m.ObjVal))
+        if upto < last:
+            values = np.array(m.getAttr("X",m.getVars()))
+            done = var_days[cols] < upto
+            lb[cols[done]] = ub[cols[done]] = np.round(values[done])
+            m.dispose()
+    # the last block covers every variable, in ir order
+    m._ir = ir
+    return m, bound
+
+# solve_mode(ir,mode,block_days,params,write_lp):
+#   solves the model in one of MODES and prints objective, full-model bound,
+#   gap and time; the report is kept on the model as m._mode_report before
+#   the solution (and with write_lp the LP file) is written
+# Returns -> gurobipy model holding the solution (all variables, ir order)
+def solve_mode(ir,mode="mip",block_days=7,params=None,write_lp=False):
+    if mode not in MODES:
+        raise ValueError("unknown solve mode {}, expected one of {}".format(mode,MODES))
+    start = time.perf_counter()
+    if mode == "mip":
+        m = run_model.build_ir_model(ir,params=params)
+        profiling.optimize(m)
+        bound = m.ObjBound
+    elif mode == "lp":
+        m, bound = solve_lp_repair(ir,params)
+    elif mode == "xy":
+        m, bound = solve_xy(ir,params)
+    else:
+        m, bound = solve_blocks(ir,params,block_days)
+
+    report = {"mode":mode,"objective":None,"bound":bound,"gap":None,"time":time.perf_counter() - start}
+    if m.SolCount > 0:
+        report["objective"] = m.ObjVal
+        report["gap"] = abs(m.ObjVal - bound) / abs(m.ObjVal) if m.ObjVal != 0 else 0.0
+        print('Mode {mode}: objective {objective:,.2f}, full-model bound {bound:,.2f}, gap {gap:.2%}, time {time:.2f}s'.format(**report))
+    m._mode_report = report
+
+    m._ir = ir
+    run_model.print_solution(m,write_lp=write_lp)
+    return m
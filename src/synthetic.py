@@ -0,0 +1,94 @@
+#%%
+import argparse
+import os
+import random
+
+"""
+Synthetic instances at configurable scale
+
+Writes the six input csvs in the same layout as data/ (see read_data):
+- resources.csv:   resource1, resource2, ...
+- ppe.csv / respirators.csv: recipes of 2-3 resources each
+- factories.csv:   cost of every equipment, starting stock of every resource
+- hospitals.csv:   one demand curve per hospital, peaking on a random day
+- shipping.csv:    arcs between random ordered pairs of places; every
+                   hospital gets at least one arc from a factory
+
+    python synthetic.py out/synth --factories 20 --hospitals 200 --days 30
+"""
+
+
+# gen_instance(factories,hospitals,days,resources,ppe,respirators,density,seed):
+#   a random instance; density is the fraction of ordered place pairs with an arc
+# Returns -> dict of csv name -> list of rows
+def gen_instance(factories=6,hospitals=17,days=30,resources=7,ppe=2,respirators=3,density=0.5,seed=0):
+    rng = random.Random(seed)
+    resource_names = ["resource{}".format(i + 1) for i in range(resources)]
+    ppe_names = ["ppe{}".format(i + 1) for i in range(ppe)]
+    respirator_names = ["respirator{}".format(i + 1) for i in range(respirators)]
+    factory_names = ["factory{}".format(i + 1) for i in range(factories)]
+    hospital_names = ["hospital{}".format(i + 1) for i in range(hospitals)]
+
+    def recipe(name):
+        row = [name]
+        for r in rng.sample(resource_names,min(resources,rng.randint(2,3))):
+            row += [r,rng.randint(1,5)]
+        return row
+
+    factory_rows = []
+    for f in factory_names:
+        row = [f]
+        for e in ppe_names:
+            row += [e,round(rng.uniform(1,5),2)]
+        for e in respirator_names:
+            row += [e,round(rng.uniform(10,90),2)]
+        for r in resource_names:
+            row += [r,rng.randint(0,3000)]
+        factory_rows.append(row)
+
+    hospital_rows = []
+    for h in hospital_names:
+        peak, height, width = rng.randint(1,days), rng.randint(10,1000), rng.uniform(2,days / 3 + 2)
+        hospital_rows.append([h] + [int(height * 2 ** (-((d - peak) / width) ** 2)) for d in range(1,days + 1)])
+
+    places = factory_names + hospital_names
+    arcs = {(a,b) for a in places for b in places if a != b and rng.random() < density}
+    for h in hospital_names:
+        if not any((f,h) in arcs for f in factory_names):
+            arcs.add((rng.choice(factory_names),h))
+    shipping_rows = [[a,b,rng.randint(10,500),round(rng.uniform(1,100),2)] for a,b in sorted(arcs)]
+
+    return {"resources.csv":[resource_names],
+            "ppe.csv":[recipe(e) for e in ppe_names],
+            "respirators.csv":[recipe(e) for e in respirator_names],
+            "factories.csv":factory_rows,
+            "hospitals.csv":hospital_rows,
+            "shipping.csv":shipping_rows}
+
+# write_instance(instance,data_dir):
+#   writes the csvs of gen_instance to data_dir
+def write_instance(instance,data_dir):
+    os.makedirs(data_dir,exist_ok=True)
+    for name,rows in instance.items():
+        with open(os.path.join(data_dir,name),"w") as f:
+            f.writelines(", ".join(str(c) for c in row) + "\n" for row in rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write a synthetic instance of the model")
+    parser.add_argument("out",help="directory for the csvs")
+    parser.add_argument("--factories",type=int,default=6)
+    parser.add_argument("--hospitals",type=int,default=17)
+    parser.add_argument("--days",type=int,default=30)
+    parser.add_argument("--resources",type=int,default=7)
+    parser.add_argument("--ppe",type=int,default=2)
+    parser.add_argument("--respirators",type=int,default=3)
+    parser.add_argument("--density",type=float,default=0.5,help="fraction of ordered place pairs with an arc")
+    parser.add_argument("--seed",type=int,default=0)
+    args = parser.parse_args(argv)
+
+    write_instance(gen_instance(args.factories,args.hospitals,args.days,args.resources,args.ppe,
+                                args.respirators,args.density,args.seed),args.out)
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,256 @@
+#%%
+import collections
+import time
+import numpy as np
+import model_ir
+import profiling
+import run_model
+
+"""
+Incremental updates of a solved model
+
+Small data edits (a lane's capacity, a factory's stock, ...) are applied to
+the live Gurobi model and its ir in place, instead of rebuilding both from
+the csvs, then the model is re-optimized from the previous solution:
+
+    m = format_data.solve(format_data.build_model("../data"))
+    m = updates.update_model(m, [updates.ArcCapacity("quebec_factory", "qikiqtami_general", 150),
+                                 updates.HospitalDemand("toronto_general", 12, 3500)])
+
+Each delta only touches the rows / columns it concerns:
+- ArcCapacity:    the capacities rows of the arc (every day)
+- ArcCost:        the objective of the arc's s variables
+- FactoryStock:   the day-1 onhand row of (material, factory)
+- HospitalDemand: the demand rows of (hospital, day)
+- RemoveArc:      capacity 0 on every day, so nothing is shipped on it
+- AddArc:         new z / s variables and capacities / shipped rows for one
+                  arc (families "z_added", "s_added", "capacities_added",
+                  "shipped_added"); an existing arc is given the new
+                  capacity and cost instead
+Arcs are (start, end) place names; days are model days 1..n_days-1. Adding an
+arc or stock a material never had can make variables useful that the
+presolve dropped, so those need a model built with prune=False.
+"""
+
+ArcCapacity = collections.namedtuple("ArcCapacity",["start","end","capacity"])
+ArcCost = collections.namedtuple("ArcCost",["start","end","cost"])
+FactoryStock = collections.namedtuple("FactoryStock",["factory","material","amount"])
+HospitalDemand = collections.namedtuple("HospitalDemand",["hospital","day","demand"])
+AddArc = collections.namedtuple("AddArc",["start","end","capacity","cost"])
+RemoveArc = collections.namedtuple("RemoveArc",["start","end"])
+
+
+### Lookups
+
+def place_index(ir,name):
+    if name not in ir["places"] or name == model_ir.DUMMY:
+        raise ValueError("unknown place {}".format(name))
+    return ir["places"].index(name)
+
+def material_index(ir,name):
+    if name not in ir["materials"]:
+        raise ValueError("unknown material {}".format(name))
+    return ir["materials"].index(name)
+
+# arc_index(ir,start,end):
+#   id of the arc start -> end, -1 if there is none
+def arc_index(ir,start,end):
+    arcs = np.flatnonzero((ir["arc_start"] == place_index(ir,start)) & (ir["arc_end"] == place_index(ir,end)))
+    return int(arcs[0]) if len(arcs) else -1
+
+def existing_arc(ir,start,end):
+    arc = arc_index(ir,start,end)
+    if arc < 0:
+        raise ValueError("no arc {}->{}".format(start,end))
+    return arc
+
+# arc_ids(ir,arc):
+#   capacities rows and s variables of an arc, one per day (-1 if dropped)
+# Returns -> (int array, int array)
+def arc_ids(ir,arc):
+    if arc in ir.get("added_arcs",{}):
+        added = ir["added_arcs"][arc]
+        return added["capacities"], added["s"]
+    days = np.arange(1,ir["n_days"])
+    return model_ir.capacities_id(ir,arc,days), model_ir.s_id(ir,arc,days)
+
+
+# handles(blocks,ids):
+#   Gurobi variables / constraints of the given ids out of the MVar /
+#   MConstr blocks kept on the model (m._x, m._rows, see
+#   run_model.build_matrix_model), without listing the whole model
+# Returns -> list, in ids order
+def handles(blocks,ids):
+    ids = np.asarray(ids,dtype=np.int64)
+    ends = np.cumsum([b.shape[0] for b in blocks])
+    block = np.searchsorted(ends,ids,side="right")
+    found = [None] * len(ids)
+    for b in np.unique(block):
+        at = np.flatnonzero(block == b)
+        for i,h in zip(at,blocks[b][ids[at] - ends[b] + blocks[b].shape[0]].tolist()):
+            found[i] = h
+    return found
+
+
+### Deltas
+###     Each apply_* function updates the ir and collects the Gurobi changes in
+###     changes["rhs"] / changes["obj"] (id -> value), set in one call at the end
+
+def apply_arc_capacity(m,ir,delta,changes):
+    arc = existing_arc(ir,delta.start,delta.end)
+    rows = arc_ids(ir,arc)[0]
+    rows = rows[rows >= 0]
+    ir["arc_cap"][arc] = delta.capacity
+    ir["rhs"][rows] = delta.capacity
+    changes["rhs"].update(dict.fromkeys(rows.tolist(),float(delta.capacity)))
+
+def apply_arc_cost(m,ir,delta,changes):
+    arc = existing_arc(ir,delta.start,delta.end)
+    cols = arc_ids(ir,arc)[1]
+    cols = cols[cols >= 0]
+    ir["arc_cost"][arc] = delta.cost
+    ir["obj"][cols] = delta.cost
+    changes["obj"].update(dict.fromkeys(cols.tolist(),float(delta.cost)))
+
+def apply_factory_stock(m,ir,delta,changes):
+    place, mat = place_index(ir,delta.factory), material_index(ir,delta.material)
+    if place >= ir["n_factories"]:
+        raise ValueError("{} is not a factory".format(delta.factory))
+    row = int(model_ir.onhand_id(ir,mat,place,1))
+    if "presolve" in ir and delta.amount > 0 and ir["stock"][mat,place] == 0:
+        raise ValueError("{} had no {}; the presolve may have dropped what it needs, rebuild with prune=False".format(
+            delta.factory,delta.material))
+    ir["stock"][mat,place] = delta.amount
+    if row >= 0:
+        ir["rhs"][row] = delta.amount
+        changes["rhs"][row] = float(delta.amount)
+
+def apply_hospital_demand(m,ir,delta,changes):
+    hosp = place_index(ir,delta.hospital) - ir["n_factories"]
+    if hosp < 0:
+        raise ValueError("{} is not a hospital".format(delta.hospital))
+    if not 1 <= delta.day < ir["n_days"]:
+        raise ValueError("day {} is outside the planned days 1..{}".format(delta.day,ir["n_days"] - 1))
+    rows = model_ir.demand_id(ir,np.arange(len(model_ir.DEMAND_TYPES)),hosp,delta.day)
+    ir["rhs"][rows] = -delta.demand
+    changes["rhs"].update(dict.fromkeys(rows.tolist(),-float(delta.demand)))
+
+def apply_remove_arc(m,ir,delta,changes):
+    apply_arc_capacity(m,ir,ArcCapacity(delta.start,delta.end,0),changes)
+
+def apply_add_arc(m,ir,delta,changes):
+    if arc_index(ir,delta.start,delta.end) >= 0:
+        apply_arc_capacity(m,ir,ArcCapacity(delta.start,delta.end,delta.capacity),changes)
+        apply_arc_cost(m,ir,ArcCost(delta.start,delta.end,delta.cost),changes)
+        return
+    if "presolve" in ir:
+        raise ValueError("arcs can only be added to a model built with prune=False")
+    if "matrix" in ir:
+        raise ValueError("arcs can only be added to a model whose coefficients are in memory, not streamed")
+    add_arc(m,ir,place_index(ir,delta.start),place_index(ir,delta.end),delta.capacity,delta.cost)
+
+# add_arc(m,ir,start,end,capacity,cost):
+#   appends an arc to the ir and its variables and rows to the model: z per
+#   (day, material) and s per day, with their entries on the onhand, demand
+#   and availability rows of both ends, and capacities / shipped rows per day
+def add_arc(m,ir,start,end,capacity,cost):
+    import scipy.sparse as sp
+
+    K, D = len(ir["materials"]), ir["n_days"] - 1
+    arc, n, c = len(ir["arc_start"]), ir["n_vars"], ir["n_constrs"]
+    for key,value in (("arc_start",start),("arc_end",end),("arc_cap",capacity),("arc_cost",cost)):
+        ir[key] = np.append(ir[key],value)
+
+    day, mat = model_ir.grid(D,K)
+    day = day + 1
+    days = np.arange(1,D + 1)
+    offset = model_ir.add_family(ir["var_families"],"z_added","z_{}_{}_{}",("material","arc","day"),
+                                 {"material":mat,"arc":np.full(len(mat),arc),"day":day},n)
+    offset = model_ir.add_family(ir["var_families"],"s_added","s_{}_{}",("arc","day"),
+                                 {"arc":np.full(D,arc),"day":days},offset)
+    z_cols, s_cols = np.arange(n,n + D * K), np.arange(n + D * K,offset)
+    obj = np.concatenate([np.zeros(D * K),np.full(D,float(cost))])
+
+    offset = model_ir.add_family(ir["constr_families"],"capacities_added","capacities_{}_{}",("arc","day"),
+                                 {"arc":np.full(D,arc),"day":days},c)
+    offset = model_ir.add_family(ir["constr_families"],"shipped_added","shipped_{}_{}",("arc","day"),
+                                 {"arc":np.full(D,arc),"day":days},offset)
+    cap_rows, shipped_rows = np.arange(c,c + D), np.arange(c + D,offset)
+    rhs = np.concatenate([np.full(D,float(capacity)),np.zeros(D)])
+    sense = np.array(["<"] * D + ["="] * D)
+
+    # entries on existing rows, and on the new ones
+    arcs = np.full(len(mat),arc)
+    old = model_ir.stack(model_ir.onhand_shipments(ir,mat,arcs,day,z_cols)
+                         + model_ir.demand_shipments(ir,mat,arcs,day,z_cols)
+                         + model_ir.availability_shipments(ir,mat,arcs,day,z_cols))
+    new = model_ir.stack([(cap_rows,s_cols,1),(shipped_rows[day - 1],z_cols,1),(shipped_rows,s_cols,-1)])
+
+    # the new variables get the types of the existing shipments
+    first = [model_ir.family_slice(ir["var_families"],name).start for name in ("z","s")]
+    vtype = [v.VType for v in handles(m._x,first)]
+    x = m.addMVar(len(obj),obj=obj,vtype=np.array([vtype[0]] * (D * K) + [vtype[1]] * D))
+    m._x.append(x)
+    m.update()
+    for r,col,v in zip(handles(m._rows,old[0]),handles(m._x,old[1]),old[2]):
+        m.chgCoeff(r,col,v)
+    m._rows.append(m.addMConstr(sp.csr_matrix((new[2],(new[0] - c,new[1] - n)),shape=(2 * D,len(obj))),x,sense,rhs))
+
+    # kept as blocks, see run_model.ir_matrix
+    ir.setdefault("added_coefficients",[]).extend([old,new])
+    ir["obj"] = np.concatenate([ir["obj"],obj])
+    ir["rhs"] = np.concatenate([ir["rhs"],rhs])
+    ir["sense"] = np.concatenate([ir["sense"],sense])
+    ir["n_vars"], ir["n_constrs"] = n + len(obj), offset
+    ir.setdefault("added_arcs",{})[arc] = {"capacities":cap_rows,"s":s_cols}
+
+APPLY = {ArcCapacity:apply_arc_capacity,
+         ArcCost:apply_arc_cost,
+         FactoryStock:apply_factory_stock,
+         HospitalDemand:apply_hospital_demand,
+         AddArc:apply_add_arc,
+         RemoveArc:apply_remove_arc}
+
+
+# apply_deltas(m,deltas):
+#   applies deltas, in order, to the model and its ir (m._ir) without
+#   solving; if one fails, the ones before it stay applied to both
+# Returns -> dict of rhs / obj entries changed
+def apply_deltas(m,deltas):
+    ir = m._ir
+    changes = {"rhs":{},"obj":{}}
+    try:
+        for delta in deltas:
+            if type(delta) not in APPLY:
+                raise ValueError("unknown update {!r}".format(delta))
+            APPLY[type(delta)](m,ir,delta,changes)
+    finally:
+        m.update()
+        if changes["rhs"]:
+            m.setAttr("RHS",handles(m._rows,list(changes["rhs"])),list(changes["rhs"].values()))
+        if changes["obj"]:
+            m.setAttr("Obj",handles(m._x,list(changes["obj"])),list(changes["obj"].values()))
+    return changes
+
+# update_model(m,deltas):
+#   applies deltas to a solved model (from run_model.solve_ir or solve_modes)
+#   and re-optimizes from the previous solution; the update time is printed
+#   and kept on the model as m._update_time
+# Returns -> the same gurobipy model, re-optimized
+def update_model(m,deltas):
+    start = time.perf_counter()
+    blocks = list(m._x)
+    values = [x.X for x in blocks] if m.SolCount > 0 else None
+    changes = apply_deltas(m,deltas)
+    print('Update: {} deltas, {} right-hand sides and {} objective coefficients changed, {} variables'.format(
+        len(deltas),len(changes["rhs"]),len(changes["obj"]),m._ir["n_vars"]))
+
+    if values is not None:
+        for x,v in zip(blocks,values):
+            x.Start = v
+    profiling.optimize(m)
+    m._update_time = time.perf_counter() - start
+    print('Update time: {:.2f}s'.format(m._update_time))
+
+    run_model.print_solution(m)
+    return m